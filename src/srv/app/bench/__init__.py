@@ -0,0 +1,5 @@
+"""Benchmarks of the data layer against synthetic data file corpora.
+
+See `app.cmd.bench`.
+
+"""
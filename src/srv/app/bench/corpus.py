@@ -0,0 +1,121 @@
+"""Generation of synthetic corpora of Netrics data files.
+
+Data files mimic those written by the Netrics measurement service:
+trees of `Measurements` -- including those the dashboard reads and
+those it does not -- and `Meta` (including the measurement `Time`),
+one file per measurement run, named by their epoch timestamps.
+
+"""
+import json
+import random
+import time
+
+
+def make_document(ts, rng):
+    """Construct a synthetic data file document for the given epoch
+    timestamp `ts`.
+
+    """
+    download = rng.lognormvariate(4.5, 0.4)
+
+    return {
+        'Measurements': {
+            'ping_latency': {
+                f'{host}_{stat}_ms': round(base + rng.expovariate(1 / 4), 3)
+                for (host, base) in (('google', 12), ('amazon', 18), ('wikipedia', 25))
+                for stat in ('rtt_min', 'rtt_avg', 'rtt_max', 'rtt_mdev')
+            },
+            'connected_devices_arp': {
+                'devices_active': rng.randint(2, 12),
+                'devices_total': rng.randint(12, 20),
+                'devices_1day': rng.randint(6, 14),
+                'devices_1week': rng.randint(10, 18),
+            },
+            'ookla': {
+                'speedtest_ookla_download': round(download, 2),
+                'speedtest_ookla_upload': round(download / 8, 2),
+                'speedtest_ookla_jitter': round(rng.expovariate(1), 3),
+                'speedtest_ookla_latency': round(10 + rng.expovariate(1 / 5), 3),
+                'speedtest_ookla_pktloss2': 0.0,
+            },
+            'ndt7': {
+                'speedtest_ndt7_download': round(download * rng.uniform(0.8, 1.1), 2),
+                'speedtest_ndt7_upload': round(download / 8 * rng.uniform(0.8, 1.1), 2),
+                'speedtest_ndt7_downloadretrans': round(rng.random(), 3),
+                'speedtest_ndt7_minrtt': round(10 + rng.expovariate(1 / 5), 3),
+                'speedtest_ndt7_server': 'ndt-mlab1-ord06.mlab-oti.measurement-lab.org',
+            },
+            'dns_latency': {
+                'dns_query_avg_ms': round(rng.expovariate(1 / 20), 3),
+                'dns_query_max_ms': round(rng.expovariate(1 / 60), 3),
+                'error': None,
+            },
+            'last_mile_rtt': {
+                f'{host}_{stat}': round(base + rng.expovariate(1 / 2), 3)
+                for (host, base) in (('google', 4), ('amazon', 5), ('wikipedia', 6))
+                for stat in ('rtt_min_ms', 'rtt_median_ms', 'rtt_max_ms')
+            },
+            'traceroute': {
+                'google_hops': [
+                    {'hop': hop, 'ip': f'10.0.{hop}.1', 'rtt_ms': round(hop * 2.5, 3)}
+                    for hop in range(1, rng.randint(8, 14))
+                ],
+            },
+        },
+        'Meta': {
+            'Id': f'bench-{ts}',
+            'Time': ts,
+            'Version': '0.1.0',
+            'Host': {'name': 'netrics-bench', 'platform': 'linux'},
+        },
+    }
+
+
+def generate(path_pending, path_archive, count, interval=300, pending=12, now=None, seed=0):
+    """Write a corpus of `count` data files.
+
+    Files are timestamped `interval` seconds apart, ending `now`. The
+    most recent `pending` files are written to `path_pending` and the
+    remainder to `path_archive`.
+
+    Returns the epoch timestamp of the most recent file.
+
+    """
+    rng = random.Random(seed)
+
+    if now is None:
+        now = int(time.time())
+
+    path_pending.mkdir(parents=True, exist_ok=True)
+    path_archive.mkdir(parents=True, exist_ok=True)
+
+    for offset in range(count):
+        ts = now - offset * interval
+        path_dir = path_pending if offset < pending else path_archive
+
+        with (path_dir / f'{ts}.json').open('w') as fd:
+            json.dump(make_document(ts, rng), fd)
+
+    return now
+
+
+def generate_trials(conn, count, interval=3600, now=None, seed=0):
+    """Insert `count` completed trials via the given database
+    connection.
+
+    """
+    rng = random.Random(seed)
+
+    if now is None:
+        now = int(time.time())
+
+    rows = [
+        (now - offset * interval,
+         rng.randint(10, 100) * 1024 ** 2,
+         rng.randint(5, 15) * 10 ** 6)
+        for offset in range(count)
+    ]
+
+    with conn:
+        conn.executemany("insert or replace into trial (ts, size, period) values (?, ?, ?)",
+                         rows)
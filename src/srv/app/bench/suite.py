@@ -0,0 +1,86 @@
+"""Timing of dashboard handlers against a data file corpus.
+
+Each benchmark is run in its own process -- configured by the
+environment to read a synthetic corpus (see `app.cmd.bench`) -- such
+that its first ("cold") run begins with empty caches; subsequent
+("warm") runs reflect caches as populated.
+
+Usage:
+
+    python -m app.bench.suite BENCHMARK [REPEAT]
+
+Results are written to stdout as JSON.
+
+"""
+import json
+import statistics
+import sys
+import time
+
+
+def get_recent_results():
+    from app.handler import current_stats
+    return current_stats.get_recent_results
+
+
+def get_measurements():
+    from app.handler import plots
+    return plots.get_measurements
+
+
+def stat_trials():
+    import bottle
+    from app.handler import trial
+
+    # handler reads (empty) query parameters
+    bottle.request.bind({'QUERY_STRING': ''})
+
+    return trial.stat_trials
+
+
+BENCHMARKS = {
+    'get_recent_results': get_recent_results,
+    'get_measurements': get_measurements,
+    'stat_trials': stat_trials,
+}
+
+
+def measure(func, repeat):
+    """Time the first and `repeat` subsequent invocations of `func`."""
+    time_start = time.perf_counter()
+    func()
+    cold = time.perf_counter() - time_start
+
+    warm = []
+
+    for _run in range(repeat):
+        time_start = time.perf_counter()
+        func()
+        warm.append(time.perf_counter() - time_start)
+
+    return {
+        'cold_s': cold,
+        'warm_s': {
+            'min': min(warm),
+            'median': statistics.median(warm),
+            'max': max(warm),
+        } if warm else None,
+        'repeat': repeat,
+    }
+
+
+def main(argv=None):
+    (name, *args) = sys.argv[1:] if argv is None else argv
+
+    repeat = int(args[0]) if args else 5
+
+    # handlers' modules are loaded (and their data registered) untimed
+    func = BENCHMARKS[name]()
+
+    result = measure(func, repeat)
+
+    json.dump({'benchmark': name, **result}, sys.stdout)
+
+
+if __name__ == '__main__':
+    main()
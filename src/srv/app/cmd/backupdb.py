@@ -70,7 +70,7 @@ class BackupDB(Command):
     def execute_statements(self, statements):
         result = thrown = self.Nil
 
-        with db.client.connect() as conn:
+        with db.client.read() as conn:
             while True:
                 try:
                     if result is not self.Nil:
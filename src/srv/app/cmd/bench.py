@@ -0,0 +1,158 @@
+import json
+import os
+import pathlib
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+from argcmdr import Command
+
+from app.bench import corpus, suite
+
+from .run import Main
+
+
+@Main.register
+class Bench(Command):
+    """benchmark data layer against synthetic data file corpora"""
+
+    default_sizes = (500, 5_000, 50_000, 500_000)
+
+    def __init__(self, parser):
+        parser.add_argument(
+            'target',
+            metavar='path',
+            nargs='?',
+            type=pathlib.Path,
+            help="file to which to write results as JSON (default: stdout)",
+        )
+        parser.add_argument(
+            '--size',
+            action='append',
+            dest='sizes',
+            metavar='count',
+            type=int,
+            help=f"number of data files in corpus "
+                 f"(default: {', '.join(map(str, self.default_sizes))})",
+        )
+        parser.add_argument(
+            '--benchmark',
+            action='append',
+            dest='benchmarks',
+            choices=suite.BENCHMARKS,
+            metavar='name',
+            help=f"benchmark(s) to run (default: all): {', '.join(suite.BENCHMARKS)}",
+        )
+        parser.add_argument(
+            '--repeat',
+            default=5,
+            metavar='count',
+            type=int,
+            help="number of warm runs of each benchmark (default: %(default)s)",
+        )
+        parser.add_argument(
+            '--trials',
+            default=1_000,
+            metavar='count',
+            type=int,
+            help="number of trials in database (default: %(default)s)",
+        )
+        parser.add_argument(
+            '--index',
+            action='store_true',
+            help="read data files via data file index",
+        )
+        parser.add_argument(
+            '--workdir',
+            metavar='path',
+            type=pathlib.Path,
+            help="directory in which to generate corpora (default: temporary directory)",
+        )
+
+    def __call__(self, args):
+        results = {
+            'timestamp': int(time.time()),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'options': {
+                'repeat': args.repeat,
+                'trials': args.trials,
+                'index': args.index,
+            },
+            'corpora': [],
+        }
+
+        for size in args.sizes or self.default_sizes:
+            with tempfile.TemporaryDirectory(dir=args.workdir) as workdir:
+                results['corpora'].append(self.run_corpus(args, pathlib.Path(workdir), size))
+
+        if args.target:
+            with args.target.open('w') as fd:
+                json.dump(results, fd, indent=2)
+        else:
+            json.dump(results, sys.stdout, indent=2)
+            sys.stdout.write('\n')
+
+    def run_corpus(self, args, workdir, size):
+        env = dict(
+            os.environ,
+            APP_DATABASE=f'file:{workdir / "data.sqlite"}',
+            DATAFILE_PENDING=str(workdir / 'pending'),
+            DATAFILE_ARCHIVE=str(workdir / 'archive'),
+        )
+
+        # benchmark data files' reads; don't inherit persistent caches
+        env.pop('DATA_CACHE_SNAPSHOT', None)
+
+        if args.index:
+            env['DATAFILE_INDEX'] = str(workdir / 'index.sqlite')
+        else:
+            env.pop('DATAFILE_INDEX', None)
+
+        time_start = time.perf_counter()
+
+        corpus.generate(workdir / 'pending', workdir / 'archive', size)
+
+        self.run_script(env, f"""\
+from app.bench.corpus import generate_trials
+from app.data.db import sqlite as db
+with db.client.write() as conn:
+    generate_trials(conn, {args.trials})
+""")
+
+        sys.stderr.write(f"[INFO] corpus: {size} files: generated in "
+                         f"{time.perf_counter() - time_start:.1f}s\n")
+
+        benchmarks = []
+
+        for name in args.benchmarks or suite.BENCHMARKS:
+            output = self.run_script(env, '-m', 'app.bench.suite', name, str(args.repeat))
+            benchmarks.append(json.loads(output))
+
+            sys.stderr.write(f"[INFO] corpus: {size} files: {name}: "
+                             f"cold: {benchmarks[-1]['cold_s']:.3f}s\n")
+
+        return {
+            'files': size,
+            'benchmarks': benchmarks,
+        }
+
+    @staticmethod
+    def run_script(env, *args):
+        if len(args) == 1:
+            args = ('-c',) + args
+
+        process = subprocess.run(
+            (sys.executable,) + args,
+            capture_output=True,
+            env=env,
+            text=True,
+        )
+
+        if process.returncode != 0:
+            sys.stderr.write(process.stderr)
+            process.check_returncode()
+
+        return process.stdout
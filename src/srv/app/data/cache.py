@@ -0,0 +1,447 @@
+"""Memory-bounded caches of data file contents.
+
+Caches are bounded by an approximate budget of bytes -- rather than by
+their number of items -- and report counts of their hits, misses and
+evictions.
+
+Caches are compatible with `cachetools.cached` -- (and, as such, are not
+themselves thread-safe; a lock should be supplied).
+
+"""
+import collections
+import os
+import sys
+import threading
+import time
+
+import cachetools
+
+
+def sizeof(value, getsizeof=sys.getsizeof):
+    """Approximate the memory footprint of the given (JSON-like) value,
+    in bytes.
+
+    """
+    size = getsizeof(value)
+
+    if isinstance(value, dict):
+        size += sum(sizeof(key) + sizeof(item) for (key, item) in value.items())
+    elif isinstance(value, (list, tuple)):
+        size += sum(sizeof(item) for item in value)
+
+    return size
+
+
+class CacheStats:
+    """Mix-in to count cache hits, misses and evictions."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'items': len(self),
+            'currsize': self.currsize,
+            'maxsize': self.maxsize,
+        }
+
+
+class LRUCache(CacheStats, cachetools.LRUCache):
+    """Least Recently Used (LRU) cache bounded by approximate size in
+    bytes.
+
+    """
+    def __init__(self, maxsize, getsizeof=sizeof):
+        super().__init__(maxsize, getsizeof)
+
+    def __getitem__(self, key):
+        try:
+            value = super().__getitem__(key)
+        except KeyError:
+            self.misses += 1
+            raise
+
+        self.hits += 1
+        return value
+
+    def peek(self, key):
+        # retrieve without counting access nor updating recency
+        return cachetools.Cache.__getitem__(self, key)
+
+    def popitem(self):
+        item = super().popitem()
+
+        # LRUCache retrieves evicted items via __getitem__: don't count these as hits
+        self.hits -= 1
+        self.evictions += 1
+
+        return item
+
+
+class TTLCache(CacheStats, cachetools.TTLCache):
+    """Cache of items expiring after their time-to-live (TTL), bounded
+    by number of items.
+
+    """
+    def __getitem__(self, key):
+        try:
+            value = super().__getitem__(key)
+        except KeyError:
+            self.misses += 1
+            raise
+
+        self.hits += 1
+        return value
+
+    def popitem(self):
+        item = super().popitem()
+
+        # TTLCache retrieves evicted items via __getitem__: don't count these as hits
+        self.hits -= 1
+        self.evictions += 1
+
+        return item
+
+
+class FrequencySketch:
+    """Count-Min sketch of the (approximate and recent) frequency with
+    which keys are accessed.
+
+    Counters are capped at 15, and halved once the number of recorded
+    accesses reaches the sample size, such that frequencies favor
+    recent history.
+
+    """
+    depth = 4
+
+    max_count = 15
+
+    def __init__(self, width=8192):
+        self.width = width
+        self.table = [[0] * width for _row in range(self.depth)]
+        self.sample_size = 10 * width
+        self.additions = 0
+
+    def indices(self, key):
+        for row in range(self.depth):
+            yield (row, hash((row, key)) % self.width)
+
+    def increment(self, key):
+        for (row, column) in self.indices(key):
+            if self.table[row][column] < self.max_count:
+                self.table[row][column] += 1
+
+        self.additions += 1
+
+        if self.additions >= self.sample_size:
+            self.reset()
+
+    def frequency(self, key):
+        return min(self.table[row][column] for (row, column) in self.indices(key))
+
+    def reset(self):
+        for counts in self.table:
+            for (column, count) in enumerate(counts):
+                counts[column] = count // 2
+
+        self.additions //= 2
+
+
+class TinyLFUCache(CacheStats, collections.abc.MutableMapping):
+    """Window TinyLFU cache bounded by approximate size in bytes.
+
+    New items are admitted to a small LRU "window". Items leaving the
+    window are admitted to the main, segmented LRU -- consisting of
+    "probation" and "protected" segments -- only if they've been
+    accessed more frequently than the item they would evict.
+
+    As such, the cache is resistant to scans: a one-off read of many
+    items does not evict those frequently read.
+
+    """
+    def __init__(self, maxsize, getsizeof=sizeof, window=0.01, protected=0.8, sketch=None):
+        super().__init__()
+
+        self.maxsize = maxsize
+        self.getsizeof = getsizeof
+
+        self.window_maxsize = max(1, int(maxsize * window))
+        self.protected_maxsize = int((maxsize - self.window_maxsize) * protected)
+
+        self.sketch = FrequencySketch() if sketch is None else sketch
+
+        self.window = collections.OrderedDict()
+        self.probation = collections.OrderedDict()
+        self.protected = collections.OrderedDict()
+
+        self.sizes = {}
+        self.currsize = self.window_size = self.protected_size = 0
+
+    def __getitem__(self, key):
+        self.sketch.increment(key)
+
+        if key in self.window:
+            self.window.move_to_end(key)
+            value = self.window[key]
+        elif key in self.protected:
+            self.protected.move_to_end(key)
+            value = self.protected[key]
+        elif key in self.probation:
+            # promote
+            value = self.protected[key] = self.probation.pop(key)
+            self.protected_size += self.sizes[key]
+
+            while self.protected_size > self.protected_maxsize and len(self.protected) > 1:
+                # demote
+                (demoted, demoted_value) = self.protected.popitem(last=False)
+                self.protected_size -= self.sizes[demoted]
+                self.probation[demoted] = demoted_value
+        else:
+            self.misses += 1
+            raise KeyError(key)
+
+        self.hits += 1
+        return value
+
+    def __setitem__(self, key, value):
+        size = self.getsizeof(value)
+
+        if size > self.maxsize:
+            raise ValueError("value too large")
+
+        if key in self.sizes:
+            del self[key]
+
+        self.window[key] = value
+        self.sizes[key] = size
+        self.window_size += size
+        self.currsize += size
+
+        while self.window_size > self.window_maxsize and self.window:
+            (candidate, candidate_value) = self.window.popitem(last=False)
+            self.window_size -= self.sizes[candidate]
+            self.probation[candidate] = candidate_value
+            self.admit(candidate)
+
+        while self.currsize > self.maxsize:
+            self.evict(self.window or self.probation or self.protected)
+
+    def admit(self, candidate):
+        """Retain the given candidate -- placed in probation -- only if
+        it's accessed more frequently than the items it would evict.
+
+        """
+        candidate_frequency = self.sketch.frequency(candidate)
+
+        while self.currsize > self.maxsize:
+            segment = self.probation if len(self.probation) > 1 else self.protected
+
+            try:
+                victim = next(iter(segment))
+            except StopIteration:
+                victim = candidate
+
+            if victim == candidate or self.sketch.frequency(victim) >= candidate_frequency:
+                self.evict(self.probation, candidate)
+                return
+
+            self.evict(segment, victim)
+
+    def evict(self, segment, key=None):
+        if key is None:
+            key = next(iter(segment))
+
+        del segment[key]
+
+        size = self.sizes.pop(key)
+        self.currsize -= size
+
+        if segment is self.window:
+            self.window_size -= size
+        elif segment is self.protected:
+            self.protected_size -= size
+
+        self.evictions += 1
+
+    def __delitem__(self, key):
+        size = self.sizes.pop(key)
+        self.currsize -= size
+
+        if key in self.window:
+            del self.window[key]
+            self.window_size -= size
+        elif key in self.protected:
+            del self.protected[key]
+            self.protected_size -= size
+        else:
+            del self.probation[key]
+
+    def __contains__(self, key):
+        return key in self.sizes
+
+    def __iter__(self):
+        return iter(list(self.sizes))
+
+    def __len__(self):
+        return len(self.sizes)
+
+    def peek(self, key):
+        for segment in (self.window, self.probation, self.protected):
+            try:
+                return segment[key]
+            except KeyError:
+                pass
+
+        raise KeyError(key)
+
+    def setdefault(self, key, default=None):
+        if key in self:
+            return self.peek(key)
+
+        self[key] = default
+        return default
+
+    def clear(self):
+        for segment in (self.window, self.probation, self.protected):
+            segment.clear()
+
+        self.sizes.clear()
+        self.currsize = self.window_size = self.protected_size = 0
+
+    def __repr__(self):
+        return (f'{self.__class__.__name__}(maxsize={self.maxsize!r}, '
+                f'currsize={self.currsize!r}, items={len(self)!r})')
+
+
+POLICIES = {
+    'lru': LRUCache,
+    'tinylfu': TinyLFUCache,
+}
+
+
+def make_cache(maxsize, policy='tinylfu'):
+    """Construct a cache of the given size (in bytes) and eviction
+    `policy` (lru or tinylfu).
+
+    """
+    try:
+        cache_class = POLICIES[policy]
+    except KeyError:
+        raise ValueError(f'unsupported cache policy: {policy}') from None
+
+    return cache_class(maxsize)
+
+
+class NegativeCache:
+    """Record of files which could not be read, by their identity
+    -- `(st_mtime_ns, st_size)` -- at the time.
+
+    Entries are keyed by the given `key` function of files' paths --
+    (by default the paths themselves).
+
+    Files so recorded need not be read again until they change.
+
+    Files modified too recently to be considered stable -- e.g. those
+    still being written -- are not recorded.
+
+    """
+    def __init__(self, maxsize=10_000, settle_ns=(2 * 10 ** 9), key=None):
+        self.maxsize = maxsize
+        self.settle_ns = settle_ns
+        self.key = (lambda path: path) if key is None else key
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.skips = self.failures = self.retries = 0
+
+    @staticmethod
+    def identify(path):
+        stat = os.stat(path)
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def check(self, path):
+        """Determine whether the given file is known to be unreadable,
+        (and is unchanged since it was recorded).
+
+        """
+        entry_key = self.key(path)
+
+        with self.lock:
+            recorded = self.entries.get(entry_key)
+
+        if recorded is None:
+            return False
+
+        try:
+            identity = self.identify(path)
+        except OSError:
+            identity = None
+
+        with self.lock:
+            if identity == recorded:
+                self.skips += 1
+                return True
+
+            self.entries.pop(entry_key, None)
+            self.retries += 1
+            return False
+
+    def add(self, path):
+        """Record the given file as unreadable."""
+        try:
+            identity = self.identify(path)
+        except OSError:
+            return
+
+        with self.lock:
+            self.failures += 1
+
+            if time.time_ns() - identity[0] < self.settle_ns:
+                return
+
+            self.entries[self.key(path)] = identity
+
+            while len(self.entries) > self.maxsize:
+                del self.entries[next(iter(self.entries))]
+
+    def discard(self, path):
+        with self.lock:
+            self.entries.pop(self.key(path), None)
+
+    def keys(self):
+        with self.lock:
+            return list(self.entries)
+
+    def items(self):
+        with self.lock:
+            return list(self.entries.items())
+
+    def update(self, items):
+        """Record the given pairs of entry key and file identity."""
+        with self.lock:
+            self.entries.update(items)
+
+            while len(self.entries) > self.maxsize:
+                del self.entries[next(iter(self.entries))]
+
+    def pop(self, entry_key):
+        with self.lock:
+            return self.entries.pop(entry_key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        return {
+            'entries': len(self.entries),
+            'skips': self.skips,
+            'failures': self.failures,
+            'retries': self.retries,
+        }
+
+    def __len__(self):
+        return len(self.entries)
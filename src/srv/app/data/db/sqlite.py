@@ -1,7 +1,18 @@
+import contextlib
+import json
+import queue as q
 import sqlite3
 import threading
+import time
+from concurrent import futures
+
+from loguru import logger as log
 
 import app
+from app.data.generation import generation
+from app.lib.iteration import chunked
+from app.lib.sketch import QuantileSketch
+from app.task import TaskThread
 
 
 SQLITE_DEFAULT = app.APP_PATH / 'data.sqlite'
@@ -26,30 +37,603 @@ create table if not exists trial (
     size integer,
     period integer
 ) without rowid;
+
+create table if not exists trial_stats (
+    id integer primary key check (id = 1),
+    count integer not null default 0,
+    rates integer not null default 0,
+    total real not null default 0,
+    squares real not null default 0,
+    win_lo real,
+    win_hi real,
+    win_count integer not null default 0,
+    win_total real not null default 0,
+    refreshed_count integer not null default 0,
+    success_threshold real,
+    success_count integer not null default 0
+);
+
+insert or ignore into trial_stats (id) values (1);
+
+create table if not exists sketch (
+    name text primary key,
+    data text not null
+) without rowid;
+
+{trial_stats_triggers}
+"""
+
+TRIAL_STATS_TRIGGERS = """\
+create trigger if not exists trial_stats_insert after insert on trial
+when new.size is not null and new.period is not null
+begin
+    {trial_stats_add};
+end;
+
+create trigger if not exists trial_stats_delete after delete on trial
+when old.size is not null and old.period is not null
+begin
+    {trial_stats_subtract};
+end;
+
+create trigger if not exists trial_stats_update_old after update on trial
+when old.size is not null and old.period is not null
+begin
+    {trial_stats_subtract};
+end;
+
+create trigger if not exists trial_stats_update_new after update on trial
+when new.size is not null and new.period is not null
+begin
+    {trial_stats_add};
+end;
+"""
+
+#
+# trial_stats summarizes completed trials' rates (in bytes/second) -- their count,
+# sum and sum of squares -- as trials are written (by the above triggers).
+#
+# It also counts those trials whose rates (in Mbit/s) exceed the success threshold
+# -- the latest Ookla download measurement -- as last set (see refresh_trial_success).
+#
+# Additionally it summarizes those rates falling within the window of the rates'
+# 2nd through 9th deciles, (for their trimmed mean). The window's boundaries are
+# recomputed only periodically (see refresh_trial_window) -- as estimated by the
+# quantile sketch of trial rates (TRIAL_SKETCH); in the meantime, rates are
+# summarized according to the boundaries as last computed.
+#
+TRIAL_STATS_UPDATE = """\
+update trial_stats set
+        count = count {sign} 1,
+        rates = rates {sign} ({rate} is not null),
+        total = total {sign} coalesce({rate}, 0),
+        squares = squares {sign} coalesce({rate} * {rate}, 0),
+        win_count = win_count {sign} coalesce({in_window}, 0),
+        win_total = win_total {sign} (case when {in_window} then {rate} else 0 end),
+        success_count = success_count {sign} coalesce({success}, 0)
+    where id = 1\
+"""
+
+
+def format_trial_stats_update(row, sign):
+    rate = f'(1000000.0 * {row}.size / {row}.period)'
+    in_window = f'({rate} between coalesce(win_lo, {rate}) and coalesce(win_hi, {rate}))'
+    success = f'(8.0 * {row}.size / {row}.period > success_threshold)'
+    return TRIAL_STATS_UPDATE.format(sign=sign, rate=rate, in_window=in_window, success=success)
+
+
+TRIAL_STATS_TRIGGERS = TRIAL_STATS_TRIGGERS.format(
+    trial_stats_add=format_trial_stats_update('new', '+'),
+    trial_stats_subtract=format_trial_stats_update('old', '-'),
+)
+
+PREPARE_DATABASE = PREPARE_DATABASE.format(trial_stats_triggers=TRIAL_STATS_TRIGGERS)
+
+# schema version (pragma user_version) as of which trial_stats is maintained
+TRIAL_STATS_VERSION = 1
+
+# schema version as of which the quantile sketch of trial rates is maintained
+TRIAL_SKETCH_VERSION = 2
+
+# schema version as of which trial_stats counts successful trials
+TRIAL_SUCCESS_VERSION = 3
+
+TRIAL_SKETCH = 'trial.rate'
+
+# trial_stats' window is recomputed whenever the number of trials has changed by
+# this fraction since it was last computed -- (or, regardless, while trials are few)
+TRIAL_WINDOW_REFRESH = 0.1
+
+# number of trials below which trial_stats' window is recomputed upon every write
+TRIAL_WINDOW_EXACT = 100
+
+COMPLETE_TRIAL_RATES = """\
+select 1000000.0 * size / period as rate from trial
+where size is not null and period is not null\
 """
 
 
-class Client(threading.local):
+# seconds to wait for locks held by other connections
+SQLITE_BUSY_TIMEOUT = app.config('SQLITE_BUSY_TIMEOUT', default=30, cast=float)
+
+# maximum number of concurrently-open reader connections
+SQLITE_READERS = app.config('SQLITE_READERS', default=4, cast=int)
+
+# number of compiled statements cached per connection
+SQLITE_CACHED_STATEMENTS = app.config('SQLITE_CACHED_STATEMENTS', default=128, cast=int)
+
+# seconds after which unused connections are closed
+SQLITE_IDLE_TIMEOUT = app.config('SQLITE_IDLE_TIMEOUT', default=300, cast=float)
+
+# whether submitted writes are queued to a dedicated writer thread, which commits
+# them in groups -- (trading a few milliseconds' latency for fewer fsyncs)
+SQLITE_WRITE_BEHIND = app.config('SQLITE_WRITE_BEHIND', default=False, cast=bool)
+
+# seconds for which the writer thread collects queued writes into a transaction
+SQLITE_WRITE_DELAY = app.config('SQLITE_WRITE_DELAY', default=0.005, cast=float)
+
+# maximum number of queued writes committed per transaction
+SQLITE_WRITE_BATCH = app.config('SQLITE_WRITE_BATCH', default=100, cast=int)
+
+# seconds for which handlers await the results of submitted writes
+SQLITE_WRITE_TIMEOUT = app.config('SQLITE_WRITE_TIMEOUT', default=60, cast=float)
+
+
+class PoolExhausted(sqlite3.OperationalError):
+    """Raised when no reader connection is freed within the busy
+    timeout.
+
+    """
+
 
-    @staticmethod
-    def make_connection():
+class WriteQueueClosed(sqlite3.OperationalError):
+    """Raised for writes queued to a writer thread which has stopped."""
+
+
+class Client:
+    """Manager of connections to the (write-ahead-logged) database.
+
+    Reads are performed via a bounded pool of connections, (which may
+    proceed concurrently with each other and with writes); and, writes
+    are performed via a single connection, one at a time.
+
+    Connections are shared between threads, (though not concurrently),
+    and closed once they've been idle for `idle_timeout` seconds (see
+    `close_idle`).
+
+    Where `write_behind` is enabled, writes submitted via `submit` are
+    committed in groups by a dedicated writer thread (see `WriteQueue`),
+    until `stop_event` is set.
+
+    """
+    def __init__(self,
+                 readers=SQLITE_READERS,
+                 busy_timeout=SQLITE_BUSY_TIMEOUT,
+                 cached_statements=SQLITE_CACHED_STATEMENTS,
+                 idle_timeout=SQLITE_IDLE_TIMEOUT,
+                 write_behind=SQLITE_WRITE_BEHIND,
+                 stop_event=None):
+        self.busy_timeout = busy_timeout
+        self.cached_statements = cached_statements
+        self.idle_timeout = idle_timeout
+        self.write_behind = write_behind
+        self.stop_event = threading.Event() if stop_event is None else stop_event
+
+        self.reader_slots = threading.BoundedSemaphore(readers)
+        self.reader_lock = threading.Lock()
+        self.readers = []  # idle reader connections as (conn, last used)
+
+        self.writer_lock = threading.Lock()
+        self.writer = None
+        self.writer_used = None
+
+        self.write_queue_lock = threading.Lock()
+        self.write_queue = None
+
+    def make_connection(self, **kwargs):
         return sqlite3.connect(
             app.config('APP_DATABASE', default=f'file:{SQLITE_DEFAULT}'),
             uri=True,
+            timeout=self.busy_timeout,
+            cached_statements=self.cached_statements,
+            check_same_thread=False,
+            **kwargs,
         )
 
-    def connect(self):
+    def make_reader(self):
+        # autocommit: reads hold no transaction (nor WAL snapshot) between statements
+        conn = self.make_connection(isolation_level=None)
+        conn.execute("pragma query_only = on")
+        return conn
+
+    @contextlib.contextmanager
+    def read(self):
+        """Retrieve a reader connection from the pool for the duration
+        of the context.
+
+        """
+        if not self.reader_slots.acquire(timeout=self.busy_timeout):
+            raise PoolExhausted('no reader connection available')
+
         try:
-            conn = self.connection
-        except AttributeError:
-            conn = self.connection = self.make_connection()
+            with self.reader_lock:
+                conn = self.readers.pop()[0] if self.readers else None
 
-        return conn
+            if conn is None:
+                conn = self.make_reader()
+
+            try:
+                yield conn
+            finally:
+                with self.reader_lock:
+                    self.readers.append((conn, time.monotonic()))
+        finally:
+            self.reader_slots.release()
+
+    @contextlib.contextmanager
+    def write(self):
+        """Retrieve the writer connection for the duration of the
+        context.
+
+        Statements of the context are committed upon its exit, (or
+        rolled back upon error).
+
+        """
+        with self.writer_lock:
+            if self.writer is None:
+                self.writer = self.make_connection()
+
+            try:
+                with self.writer:
+                    yield self.writer
+            finally:
+                self.writer_used = time.monotonic()
+
+    def submit(self, func):
+        """Execute the write `func(conn)` via the writer connection.
+
+        Returns a `Future` of the result of `func`.
+
+        Where `write_behind` is enabled, `func` is queued to the writer
+        thread, and executed (within a savepoint) in a transaction
+        shared with other queued writes; otherwise, it is executed
+        immediately, in its own transaction. Either way, the write is
+        committed once its future is resolved; and, should `func` raise
+        an exception, its (own) statements are rolled back.
+
+        Committed writes advance the data generation (see
+        `app.data.generation`) before their futures are resolved.
+
+        Once `stop_event` is set (or should the writer thread otherwise
+        have stopped), writes are executed immediately.
+
+        """
+        if self.write_behind and not self.stop_event.is_set():
+            with self.write_queue_lock:
+                if self.write_queue is None or not self.write_queue.is_alive():
+                    self.write_queue = WriteQueue.launch(self, stop_event=self.stop_event)
+
+            try:
+                return self.write_queue.put(func)
+            except WriteQueueClosed:
+                pass
+
+        future = futures.Future()
+
+        try:
+            with self.write() as conn:
+                result = func(conn)
+        except Exception as exc:
+            future.set_exception(exc)
+        else:
+            generation.advance()
+            future.set_result(result)
+
+        return future
+
+    def close_idle(self, idle_timeout=None):
+        """Close connections which have not been used in the last
+        `idle_timeout` seconds.
+
+        """
+        if idle_timeout is None:
+            idle_timeout = self.idle_timeout
+
+        cutoff = time.monotonic() - idle_timeout
+
+        with self.reader_lock:
+            idle = [conn for (conn, used) in self.readers if used < cutoff]
+            self.readers = [(conn, used) for (conn, used) in self.readers if used >= cutoff]
+
+        if self.writer_lock.acquire(blocking=False):
+            try:
+                if self.writer is not None and self.writer_used < cutoff:
+                    idle.append(self.writer)
+                    self.writer = None
+            finally:
+                self.writer_lock.release()
+
+        for conn in idle:
+            conn.close()
+
+        log.opt(lazy=True).debug('sqlite | closed idle connections: {}', lambda: len(idle))
+
+    def checkpoint(self, mode='PASSIVE'):
+        """Checkpoint the write-ahead log (WAL) into the database.
+
+        `PASSIVE` checkpoints do not interfere with readers nor with
+        writers; (and so may not checkpoint the full log).
+
+        """
+        with self.write() as conn:
+            (busy, pages, checkpointed) = conn.execute(f"pragma wal_checkpoint({mode})").fetchone()
+
+        log.debug('sqlite | checkpointed: {}/{} pages (busy: {})', checkpointed, pages, busy)
 
     def prepare_database(self):
-        with self.connect() as conn:
+        with self.write() as conn:
+            conn.execute("pragma journal_mode = wal")
             conn.executescript(PREPARE_DATABASE)
 
+            ((version,),) = conn.execute("pragma user_version")
+
+            if version < TRIAL_STATS_VERSION:
+                # summarize trials recorded prior to maintenance of trial_stats
+                conn.execute(f"""\
+                    update trial_stats set (count, rates, total, squares) = (
+                        select count(1), count(rate), total(rate), total(rate * rate)
+                        from ({COMPLETE_TRIAL_RATES})
+                    )
+                """)
+
+            if version < TRIAL_SKETCH_VERSION:
+                # sketch trials recorded prior to maintenance of the sketch
+                sketch = QuantileSketch()
+
+                cursor = conn.execute(COMPLETE_TRIAL_RATES)
+
+                sketch.extend(rate for (rate,) in cursor if rate is not None)
+
+                put_sketch(conn, TRIAL_SKETCH, sketch)
+
+                refresh_trial_window(conn, force=True)
+
+            if version < TRIAL_SUCCESS_VERSION:
+                # extend trial_stats (and its triggers) as recorded prior to success_count
+                columns = {name for (_cid, name, *_info)
+                           in conn.execute("pragma table_info(trial_stats)")}
+
+                if 'success_count' not in columns:
+                    conn.execute("alter table trial_stats add column success_threshold real")
+                    conn.execute("alter table trial_stats add column "
+                                 "success_count integer not null default 0")
+
+                for trigger in ('insert', 'delete', 'update_old', 'update_new'):
+                    conn.execute(f"drop trigger if exists trial_stats_{trigger}")
+
+                conn.executescript(TRIAL_STATS_TRIGGERS)
+
+                conn.execute(f"pragma user_version = {TRIAL_SUCCESS_VERSION}")
+
+
+class WriteQueue(TaskThread):
+    """Execute writes queued to the given `client` in batches.
+
+    Queued writes are collected for up to `delay` seconds (or until
+    `max_items` are collected), and then executed, each within its own
+    savepoint, in a single transaction -- such that the batch costs a
+    single commit.
+
+    The queue is checked for `stop_event` every `interval` seconds.
+    Once stopped, the queue is closed to further writes (which raise
+    `WriteQueueClosed`), and those already queued are committed -- or,
+    should the thread instead crash, failed -- such that no write's
+    future is left pending.
+
+    """
+    def __init__(self, client, delay=SQLITE_WRITE_DELAY, max_items=SQLITE_WRITE_BATCH,
+                 interval=1, stop_event=None):
+        super().__init__(daemon=True)
+        self.client = client
+        self.delay = delay
+        self.max_items = max_items
+        self.interval = interval
+        self.stop_event = threading.Event() if stop_event is None else stop_event
+        self.queue = q.SimpleQueue()
+        self.lock = threading.Lock()
+        self.closed = False
+
+    def put(self, func):
+        future = futures.Future()
+
+        with self.lock:
+            if self.closed:
+                raise WriteQueueClosed('write queue stopped')
+
+            self.queue.put((func, future))
+
+        return future
+
+    def close(self):
+        """Close the queue to further writes, and return those remaining."""
+        with self.lock:
+            self.closed = True
+
+        remaining = []
+
+        while True:
+            try:
+                remaining.append(self.queue.get_nowait())
+            except q.Empty:
+                return remaining
+
+    def __call__(self):
+        batch = []
+
+        try:
+            while not self.stop_event.is_set():
+                try:
+                    batch = [self.queue.get(timeout=self.interval)]
+                except q.Empty:
+                    continue
+
+                deadline = time.monotonic() + self.delay
+
+                while len(batch) < self.max_items and (timeout := deadline - time.monotonic()) > 0:
+                    try:
+                        batch.append(self.queue.get(timeout=timeout))
+                    except q.Empty:
+                        break
+
+                self.execute(batch)
+        except BaseException as exc:
+            for (_func, future) in batch + self.close():
+                if not future.done():
+                    future.set_exception(exc)
+
+            raise
+        else:
+            # commit writes queued prior to stop
+            for remaining in chunked(self.close(), self.max_items):
+                self.execute(remaining)
+
+    def execute(self, batch):
+        outcomes = []
+
+        try:
+            with self.client.write() as conn:
+                conn.execute("begin immediate")
+
+                for (func, _future) in batch:
+                    conn.execute("savepoint queued_write")
+
+                    try:
+                        outcomes.append((func(conn), None))
+                    except Exception as exc:
+                        conn.execute("rollback to queued_write")
+                        outcomes.append((None, exc))
+
+                    conn.execute("release queued_write")
+        except Exception as exc:
+            log.error('write queue | batch of {} failed: {}: {}',
+                      len(batch), exc.__class__.__name__, exc)
+
+            for (_func, future) in batch:
+                future.set_exception(exc)
+
+            return
+
+        generation.advance()
+
+        for ((_func, future), (result, exc)) in zip(batch, outcomes):
+            if exc is None:
+                future.set_result(result)
+            else:
+                future.set_exception(exc)
+
+        log.opt(lazy=True).trace('write queue | committed: {}', lambda: len(batch))
+
+
+def get_sketch(conn, name):
+    """Retrieve the persisted quantile sketch of the given name (or
+    `None`).
+
+    """
+    cursor = conn.execute("select data from sketch where name = ?", (name,))
+
+    ((data,),) = cursor.fetchall() or ((None,),)
+
+    return None if data is None else QuantileSketch.from_dict(json.loads(data))
+
+
+def put_sketch(conn, name, sketch):
+    conn.execute("insert or replace into sketch values (?, ?)",
+                 (name, json.dumps(sketch.to_dict())))
+
+
+def sketch_trial(conn, rate):
+    """Add the rate of a newly-completed trial to the persisted quantile
+    sketch of trial rates.
+
+    """
+    sketch = get_sketch(conn, TRIAL_SKETCH) or QuantileSketch()
+    sketch.add(rate)
+    put_sketch(conn, TRIAL_SKETCH, sketch)
+
+
+def refresh_trial_window(conn, force=False):
+    """Recompute the window of trial rates summarized by trial_stats,
+    if the number of trials has changed sufficiently since it was last
+    computed (or if `force`).
+
+    The window consists of the 2nd through 9th deciles of rates, (or of
+    all rates if there are no more than 8 trials), as estimated by the
+    quantile sketch of trial rates -- (exactly, so long as fewer than
+    `k` trials have been sketched; see `app.lib.sketch`). The rates
+    within the window are then summed by a single (full) scan of trial,
+    (rather than by sorting them).
+
+    Returns whether the window was recomputed.
+
+    """
+    (count, refreshed_count) = conn.execute(
+        "select count, refreshed_count from trial_stats"
+    ).fetchone()
+
+    if (
+        not force and
+        count >= TRIAL_WINDOW_EXACT and
+        abs(count - refreshed_count) < refreshed_count * TRIAL_WINDOW_REFRESH
+    ):
+        return False
+
+    sketch = get_sketch(conn, TRIAL_SKETCH)
+
+    if count > 8 and sketch is not None:
+        (win_lo, win_hi) = sketch.quantiles(0.1, 0.9)
+    else:
+        (win_lo, win_hi) = (None, None)
+
+    (win_count, win_total) = conn.execute(f"""\
+        select count(rate), total(rate) from ({COMPLETE_TRIAL_RATES})
+        where rate between coalesce(?, rate) and coalesce(?, rate)
+    """, (win_lo, win_hi)).fetchone()
+
+    conn.execute("""\
+        update trial_stats
+        set win_lo = ?, win_hi = ?, win_count = ?, win_total = ?, refreshed_count = count
+    """, (win_lo, win_hi, win_count, win_total))
+
+    return True
+
+
+def refresh_trial_success(conn, threshold):
+    """Set the success threshold (in Mbit/s) of trials counted by
+    trial_stats, and recount these, if the threshold has changed.
+
+    Trials are recounted by a scan, (upon each new Ookla measurement);
+    otherwise, the count is maintained as trials are written.
+
+    Returns the count of trials exceeding the threshold.
+
+    """
+    (current, success_count) = conn.execute(
+        "select success_threshold, success_count from trial_stats"
+    ).fetchone()
+
+    if current == threshold:
+        return success_count
+
+    (success_count,) = conn.execute("""\
+        select count(1) from trial
+        where size is not null and period is not null and 8.0 * size / period > ?
+    """, (threshold,)).fetchone()
+
+    conn.execute("update trial_stats set success_threshold = ?, success_count = ?",
+                 (threshold, success_count))
+
+    return success_count
+
 
 client = Client()
 
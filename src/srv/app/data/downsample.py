@@ -0,0 +1,217 @@
+"""Reduction of time series columns to fewer points.
+
+Series are given column-wise -- as a column of timestamps and one or
+more columns of values -- as returned by `FlatFileBank.get_columns`.
+
+Series may be reduced either by aggregation of their values by time
+buckets (see `bucket_reduce`) or by selection of the points best
+preserving their shape (see `lttb`) -- or per either of these methods
+to a given number of points or time step (see `downsample`).
+
+"""
+import math
+import numbers
+import statistics
+
+
+def is_number(value):
+    return isinstance(value, numbers.Number) and not isinstance(value, bool)
+
+
+BUCKET_FUNCS = {
+    'mean': statistics.fmean,
+    'min': min,
+    'max': max,
+}
+
+METHODS = tuple(BUCKET_FUNCS) + ('lttb',)
+
+# minimum time step (in seconds) -- as buckets are labeled by whole seconds
+STEP_MIN = 1
+
+
+def bucket_reduce(ts, columns, step, func, origin=0):
+    """Reduce the given series to an aggregate of its values by time
+    buckets of `step` seconds (counted from `origin`).
+
+    Each bucket's values are reduced by `func` -- a callable accepting
+    a non-empty list of numbers (e.g. `min`).
+
+    Buckets are labeled by their start times, and returned in the order
+    of the given timestamps; buckets without values are omitted. Values
+    which are not numeric are ignored.
+
+    Returns a tuple of the bucketed timestamps and bucketed columns.
+
+    """
+    buckets = {}
+
+    for (index, timestamp) in enumerate(ts):
+        if not is_number(timestamp):
+            continue
+
+        bucket = int(origin + (timestamp - origin) // step * step)
+
+        try:
+            values = buckets[bucket]
+        except KeyError:
+            values = buckets[bucket] = [[] for _column in columns]
+
+        for (column_values, column) in zip(values, columns):
+            value = column[index]
+
+            if is_number(value):
+                column_values.append(value)
+
+    ts_out = list(buckets)
+
+    columns_out = tuple(
+        [
+            func(column_values) if column_values else None
+            for column_values in (buckets[bucket][column_index] for bucket in ts_out)
+        ]
+        for column_index in range(len(columns))
+    )
+
+    return (ts_out, columns_out)
+
+
+def bucket_mean(ts, columns, step):
+    """Reduce the given series to the means of its values by time
+    buckets of `step` seconds (see `bucket_reduce`).
+
+    """
+    return bucket_reduce(ts, columns, step, statistics.fmean)
+
+
+def lttb(ts, columns, points):
+    """Reduce the given series to `points` of its points via the
+    Largest-Triangle-Three-Buckets algorithm (Steinarsson, 2013).
+
+    The first and last points are retained; the remainder are divided
+    into `points - 2` buckets, from each of which is selected the point
+    forming the largest triangle with the previously-selected point and
+    the average point of the following bucket -- such that peaks and
+    troughs are preserved, which averaging would flatten.
+
+    Points are selected across all columns at once, (such that these
+    continue to share their timestamps): each candidate's triangles'
+    areas are summed over the columns, each normalized by the range of
+    its column's values. Non-numeric values contribute no area; points
+    without numeric timestamps are omitted.
+
+    Series of no more than `points` points are returned as given (but
+    for the latter omission).
+
+    Returns a tuple of the selected timestamps and columns.
+
+    """
+    if points < 3:
+        raise ValueError(f'points must be at least 3: {points}')
+
+    indices = [index for (index, timestamp) in enumerate(ts) if is_number(timestamp)]
+
+    if len(indices) > points:
+        scales = []
+
+        for column in columns:
+            values = [value for value in column if is_number(value)]
+            spread = max(values) - min(values) if values else 0
+            scales.append(spread or 1)
+
+        bucket_size = (len(indices) - 2) / (points - 2)
+
+        selected = [indices[0]]
+
+        for bucket in range(points - 2):
+            start = int(bucket * bucket_size) + 1
+            stop = int((bucket + 1) * bucket_size) + 1
+            stop_next = min(int((bucket + 2) * bucket_size) + 1, len(indices))
+
+            # average point of the following bucket
+            following = indices[stop:stop_next]
+            ts_next = statistics.fmean(ts[index] for index in following)
+            values_next = [
+                statistics.fmean(values) if values else None
+                for values in (
+                    [column[index] for index in following if is_number(column[index])]
+                    for column in columns
+                )
+            ]
+
+            previous = selected[-1]
+            (best_area, best_index) = (-1, None)
+
+            for index in indices[start:stop]:
+                area = 0
+
+                for (column, value_next, scale) in zip(columns, values_next, scales):
+                    (value_prev, value) = (column[previous], column[index])
+
+                    if is_number(value_prev) and is_number(value) and value_next is not None:
+                        area += abs(
+                            (ts[previous] - ts_next) * (value - value_prev) -
+                            (ts[previous] - ts[index]) * (value_next - value_prev)
+                        ) / scale
+
+                if area > best_area:
+                    (best_area, best_index) = (area, index)
+
+            selected.append(best_index)
+
+        selected.append(indices[-1])
+
+        indices = selected
+
+    return (
+        [ts[index] for index in indices],
+        tuple([column[index] for index in indices] for column in columns),
+    )
+
+
+def downsample(ts, columns, method='mean', *, points=None, step=None):
+    """Reduce the given series by the given method -- any of `METHODS`
+    -- to at most (about) `points` points, or to one point per `step`
+    seconds.
+
+    Bucket methods (`mean`, `min` and `max`) aggregate values by time
+    buckets (see `bucket_reduce`): of `step` seconds, or else of the
+    whole number of seconds dividing the series' time span into at most
+    `points` buckets. The `lttb` method selects points (see `lttb`):
+    `points` of them, or else the number of `step` buckets spanned by
+    the series.
+
+    Series of no more than `points` points are returned as given.
+
+    Returns a tuple of the reduced timestamps and columns.
+
+    """
+    if (points is None) == (step is None):
+        raise TypeError("downsample() requires exactly one of 'points' and 'step'")
+
+    if method not in METHODS:
+        raise ValueError(f'unsupported method: {method}')
+
+    if step is not None and not (math.isfinite(step) and step >= STEP_MIN):
+        raise ValueError(f'step must be finite and at least {STEP_MIN}: {step}')
+
+    numbered = [timestamp for timestamp in ts if is_number(timestamp)]
+
+    if not numbered or (points is not None and len(numbered) <= points):
+        return (ts, columns)
+
+    (start, end) = (min(numbered), max(numbered))
+
+    if method == 'lttb':
+        if points is None:
+            points = max(3, math.ceil((end - start) / step))
+
+        return lttb(ts, columns, points)
+
+    if step is None:
+        origin = math.floor(start)
+        step = (end - origin) // points + 1
+    else:
+        origin = 0
+
+    return bucket_reduce(ts, columns, step, BUCKET_FUNCS[method], origin)
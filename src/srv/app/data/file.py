@@ -2,21 +2,34 @@
 import abc
 import collections
 import contextlib
+import copy
+import datetime
 import functools
 import heapq
+import itertools
 import json
+import multiprocessing
 import numbers
+import operator
 import pathlib
+import re
 import statistics
 import threading
 import time
+from concurrent import futures
 
 import cachetools
-from cachetools import TTLCache
+from decouple import Csv
 from loguru import logger as log
 
 from app import config
-from app.lib.iteration import pairwise
+from app.lib.iteration import chunked, pairwise
+from app.lib.metrics import Counter, Gauge, Histogram
+
+from . import watch
+from .generation import generation
+from .cache import make_cache, NegativeCache, TTLCache
+from .index import DataFileIndex, flatten, identify, unflatten, ROLLUP_PERIODS
 
 
 ONE_WEEK_S = 60 * 60 * 24 * 7
@@ -34,12 +47,115 @@ DATA_PATHS = (
     ((DATAFILE_ARCHIVE,) if DATAFILE_ARCHIVE else ())
 )
 
-DATAFILE_LIMIT = DATA_CACHE_SIZE = 5_000
+DATAFILE_LIMIT = 5_000
+
+# approximate memory budget (in bytes) of the cache of data file contents
+DATA_CACHE_BYTES = config('DATA_CACHE_BYTES', default=(32 * 1024 ** 2), cast=int)
+
+# eviction policy of the cache of data file contents: lru or tinylfu
+DATA_CACHE_POLICY = config('DATA_CACHE_POLICY', default='tinylfu')
+
+# number of processes with which to populate caches (0 or 1 to populate serially)
+DATA_CACHE_WORKERS = config('DATA_CACHE_WORKERS', default=0, cast=int)
+
+# number of data files to read ahead of their aggregation (0 to disable)
+DATAFILE_PREFETCH = config('DATAFILE_PREFETCH', default=0, cast=int)
+
+# number of threads with which data files are read ahead
+DATAFILE_PREFETCH_WORKERS = config('DATAFILE_PREFETCH_WORKERS', default=4, cast=int)
+
+# record of unreadable data files -- (those corrupted or still being written) --
+# such that these are not read again until they change
+#
+# (keyed by file name such that records persist as files are moved between
+# data file directories)
+DATAFILE_FAILURES = NegativeCache(key=operator.attrgetter('name'))
 
 DATAFILE_PREFIX = 'Measurements'
 
 META_PREFIX = 'Meta'
 
+DATAFILE_INDEX = config('DATAFILE_INDEX', default=None, cast=path_or_none)
+
+# number of data files looked up in the index at a time
+DATAFILE_INDEX_BATCH = 100
+
+# measurement keys whose indexed values are summarized by quantile sketches
+DATAFILE_SKETCH_KEYS = config('DATAFILE_SKETCH_KEYS',
+                              default='ookla.speedtest_ookla_download,'
+                                      'ookla.speedtest_ookla_upload,'
+                                      'ping_latency.google_rtt_avg_ms',
+                              cast=Csv())
+
+DATA_INDEX = None if DATAFILE_INDEX is None else DataFileIndex(
+    DATAFILE_INDEX,
+    META_PREFIX,
+    [f'{DATAFILE_PREFIX}.{key}' for key in DATAFILE_SKETCH_KEYS],
+)
+
+# aggregators spanning more than this many seconds are served from the data file index's
+# rollups (where configured) rather than from the data files -- (see DataFileAggregator.rollup)
+DATAFILE_ROLLUP_AGE = config('DATAFILE_ROLLUP_AGE', default=(2 * ONE_WEEK_S), cast=float)
+
+# rollups are retrieved at the finest period yielding at most this many time buckets
+DATAFILE_ROLLUP_POINTS = config('DATAFILE_ROLLUP_POINTS', default=1_000, cast=int)
+
+# method by which data file directory listings are maintained: auto, inotify, poll or off
+DATAFILE_WATCH = config('DATAFILE_WATCH', default='auto')
+
+DATAFILE_WATCH_INTERVAL = config('DATAFILE_WATCH_INTERVAL', default=5, cast=float)
+
+# tolerance (in seconds) of discrepancies between the timestamps with which data
+# files are named and the times of their measurements (Meta.Time)
+DATAFILE_TIME_SLACK = config('DATAFILE_TIME_SLACK', default=3600, cast=float)
+
+# data file name timestamp formats -- e.g.:
+#
+#   1650000000.json | 1650000000123.json | 20220415_051840.json | 2022-04-15T05:18:40.json
+#
+# (formats without time zone are interpreted as UTC)
+#
+DATAFILE_TIME_PATTERNS = (
+    re.compile(r'(?<!\d)(?P<epoch>\d{10})(?:\.\d+)?(?!\d)'),
+    re.compile(r'(?<!\d)(?P<epoch_ms>\d{13})(?!\d)'),
+    re.compile(r'(?<!\d)(?P<year>\d{4})-?(?P<month>\d{2})-?(?P<day>\d{2})[T_ -]?'
+               r'(?P<hour>\d{2})[:-]?(?P<minute>\d{2})[:-]?(?P<second>\d{2})(?!\d)'),
+)
+
+
+#
+# metrics
+#
+# (see app.handler.metrics)
+#
+DATAFILE_SCANNED = Histogram(
+    'dashboard_datafile_scanned_files',
+    'Number of data files scanned per reduction of data points',
+    buckets=(1, 10, 50, 100, 500, 1_000, 2_500, 5_000, 10_000, 50_000),
+)
+
+DATAFILE_PARSE_SECONDS = Histogram(
+    'dashboard_datafile_parse_seconds',
+    'Duration of the read and parse of data files',
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.05, 0.1),
+)
+
+DATAFILE_LISTINGS = Counter(
+    'dashboard_datafile_listings',
+    'Retrievals of data file directory listings by source',
+    ('source',),
+)
+
+CACHE_HITS = Counter('dashboard_cache_hits', 'Cache hits', ('cache',))
+
+CACHE_MISSES = Counter('dashboard_cache_misses', 'Cache misses', ('cache',))
+
+CACHE_EVICTIONS = Counter('dashboard_cache_evictions', 'Cache evictions', ('cache',))
+
+CACHE_ITEMS = Gauge('dashboard_cache_items', 'Number of items cached', ('cache',))
+
+CACHE_BYTES = Gauge('dashboard_cache_bytes', 'Approximate size of cached items', ('cache',))
+
 
 def cached(cache, key=cachetools.hashkey, lock=None):
     """Extend cachetools.cached to decorate wrapper with useful
@@ -60,16 +176,145 @@ def cached(cache, key=cachetools.hashkey, lock=None):
 
         wrapped = decorator(func)
 
+        def install(value, *args, **kwargs):
+            cache_key = key(*args, **kwargs)
+
+            with lock or contextlib.nullcontext():
+                try:
+                    cache[cache_key] = value
+                except ValueError:
+                    pass  # value too large
+
+        def cache_clear():
+            with lock or contextlib.nullcontext():
+                cache.clear()
+
         wrapped.cache = cache
         wrapped.key = key
         wrapped.lock = lock
         wrapped.populate = populate
+        wrapped.install = install
+        wrapped.cache_clear = cache_clear
 
         return wrapped
 
     return wrapped_decorator
 
 
+@functools.lru_cache(maxsize=2 ** 16)
+def parse_name_time(name):
+    """Parse the timestamp with which the given data file name is
+    labeled.
+
+    Returns None if the name does not match a supported format.
+
+    See: `DATAFILE_TIME_PATTERNS`.
+
+    """
+    for pattern in DATAFILE_TIME_PATTERNS:
+        match = pattern.search(name)
+
+        if match is None:
+            continue
+
+        groups = match.groupdict()
+
+        if 'epoch' in groups:
+            return int(groups['epoch'])
+
+        if 'epoch_ms' in groups:
+            return int(groups['epoch_ms']) / 1000
+
+        try:
+            moment = datetime.datetime(*(int(value) for value in groups.values()),
+                                       tzinfo=datetime.timezone.utc)
+        except ValueError:
+            return None
+
+        return moment.timestamp()
+
+    return None
+
+
+def prune_paths(paths, since=None, until=None, slack=DATAFILE_TIME_SLACK):
+    """Select the given paths -- sorted in descending order -- whose
+    names' timestamps fall within the time range `[since, until]`.
+
+    Range boundaries are located via binary search, such that names
+    outside of the range are not so much as parsed.
+
+    If any name encountered by the search cannot be parsed, then the
+    paths are returned in full.
+
+    """
+    def bisect(limit):
+        # first index whose time is less than limit (in descending list)
+        (low, high) = (0, len(paths))
+
+        while low < high:
+            middle = (low + high) // 2
+
+            timestamp = parse_name_time(paths[middle].name)
+
+            if timestamp is None:
+                raise ValueError(paths[middle])
+
+            if timestamp < limit:
+                high = middle
+            else:
+                low = middle + 1
+
+        return low
+
+    try:
+        start = 0 if until is None else bisect(until + slack + 1e-6)
+        stop = len(paths) if since is None else bisect(since - slack)
+    except ValueError:
+        return paths
+
+    return paths[start:stop]
+
+
+def get_prefetch_executor():
+    """Retrieve the thread pool shared by data file read-ahead."""
+    with get_prefetch_executor.lock:
+        if get_prefetch_executor.executor is None:
+            get_prefetch_executor.executor = futures.ThreadPoolExecutor(
+                DATAFILE_PREFETCH_WORKERS,
+                thread_name_prefix='prefetch',
+            )
+
+        return get_prefetch_executor.executor
+
+
+get_prefetch_executor.executor = None
+get_prefetch_executor.lock = threading.Lock()
+
+
+def datafile_key(path):
+    """Cache key of the given data file by its identity -- its name,
+    size and modification time -- rather than by its location.
+
+    As such, cached data remain valid as files are moved between data
+    file directories (*e.g.* from pending to archive).
+
+    """
+    stat = path.stat()
+    return cachetools.hashkey(path.name, stat.st_size, stat.st_mtime_ns)
+
+
+def projected_key(path, version=None):
+    """Cache key of the given data file's projected data object: its
+    identity (see `datafile_key`) and the version of the projection (by
+    default, the current version).
+
+    As such, objects projected prior to the projection's extension, but
+    cached thereafter, are never retrieved.
+
+    """
+    return datafile_key(path) + (PROJECTION.version if version is None else version,)
+
+
 def get_multikey(multikey, values):
     value = values
     for key in multikey.split('.'):
@@ -77,10 +322,121 @@ def get_multikey(multikey, values):
     return value
 
 
+class Projection:
+    """Union of the (dotted) keys of data file values which are read,
+    by which to project data files' full data objects.
+
+    Projections are applied only once keys have been registered; (until
+    then, data objects are returned in full).
+
+    The projection's `version` is incremented upon each extension.
+
+    """
+    def __init__(self):
+        self.tree = {}
+        self.version = 0
+        self.lock = threading.Lock()
+
+    def add(self, multikeys):
+        """Extend the projection by the given dotted keys.
+
+        Returns whether the projection was extended.
+
+        """
+        with self.lock:
+            # copy-on-write: the tree is read without the lock
+            tree = copy.deepcopy(self.tree)
+            extended = False
+
+            for multikey in multikeys:
+                (*parents, leaf) = multikey.split('.')
+
+                node = tree
+
+                for key in parents:
+                    node = node.setdefault(key, {})
+
+                    if node is True:
+                        # ancestor already projected in full
+                        break
+                else:
+                    if node.get(leaf) is not True:
+                        node[leaf] = True
+                        extended = True
+
+            self.tree = tree
+
+            # (versioned only once the tree is extended: objects projected as of a
+            # version are projected by at least its tree)
+            if extended:
+                self.version += 1
+
+        return extended
+
+    def __contains__(self, multikey):
+        """Determine whether the given dotted key is projected, (either
+        itself or by an ancestor).
+
+        """
+        node = self.tree
+
+        for key in multikey.split('.'):
+            try:
+                node = node[key]
+            except KeyError:
+                return False
+
+            if node is True:
+                return True
+
+        return False
+
+    def __call__(self, values):
+        tree = self.tree
+        return self.select(values, tree) if tree else values
+
+    @classmethod
+    def select(cls, values, tree):
+        selected = {}
+
+        for (key, subtree) in tree.items():
+            try:
+                value = values[key]
+            except (KeyError, TypeError):
+                continue
+
+            if subtree is True:
+                selected[key] = value
+            elif isinstance(value, dict):
+                selected[key] = cls.select(value, subtree)
+
+        return selected
+
+
+#
+# Cached data objects are projected by the union of keys read by all aggregators
+# applied to DataFileBanks -- i.e. by all "registered" queries.
+#
+# Handlers should register their aggregators upon import -- see register() --
+# such that the projection is complete prior to the population of caches.
+# (Otherwise, the projection is extended upon the first query of each novel key,
+# at the cost of clearing the cache.)
+#
+PROJECTION = Projection()
+
+
+class UnreadableDataFile(ValueError):
+    """Raised for data files known to be unreadable (and unchanged)."""
+
+
 class DataFileBank:
     """Interface to read operations on sets of Netrics data files."""
 
-    DATA_FILE_READ_ERRORS = (json.JSONDecodeError, UnicodeDecodeError)
+    DATA_FILE_READ_ERRORS = (json.JSONDecodeError, UnicodeDecodeError, UnreadableDataFile)
+
+    # files may also be moved or removed between their listing and their reading
+    # (and their cache keys' stat) -- such files are skipped, (but not recorded)
+    DATA_FILE_SKIP_ERRORS = DATA_FILE_READ_ERRORS + (FileNotFoundError,)
 
     def __init__(self,
                  prefix=DATAFILE_PREFIX,
@@ -88,70 +444,215 @@ class DataFileBank:
                  dirs=DATA_PATHS,
                  round_to=None,
                  flat=False,
-                 meta_prefix=META_PREFIX):
+                 meta_prefix=META_PREFIX,
+                 index=DATA_INDEX,
+                 prefetch=DATAFILE_PREFETCH,
+                 rollup_age=DATAFILE_ROLLUP_AGE):
         self.prefix = prefix
         self.file_limit = file_limit
         self.dirs = dirs
         self.round_to = round_to
         self.flat = flat
         self.meta_prefix = meta_prefix
+        self.index = index
+        self.prefetch = prefetch
+        self.rollup_age = rollup_age
 
     def get_points(self, *ops, **named_ops):
         op_stack = dict(((str(op), op) for op in ops), **named_ops)
-        points = dict.fromkeys(op_stack)
 
-        if self.flat and len(points) > 1:
+        if self.flat and len(op_stack) > 1:
             raise ValueError("cannot flatten multiple keys")
 
-        for (dataset, dataset1) in pairwise(self.iter_datasets()):
-            (data, full_data) = dataset
-
-            for (write_key, aggregator) in tuple(op_stack.items()):
-                try:
-                    points[write_key] = aggregator(
-                        data,
-                        points[write_key],
-                        {
-                            'data': full_data,
-                            'points': points,
-                            'write_key': write_key,
-                            'file_limit': self.file_limit,
-                            'last': dataset1 is None,
-                            'meta_prefix': self.meta_prefix,
-                            'flat': self.flat,
-                        },
-                    )
-                except aggregator.stop_reduce as stop_reduce:
-                    points[write_key] = self.round_value(stop_reduce.value)
-                    del op_stack[write_key]
-
-                #
-                # note: the following is left for educational purposes only
-                #
-                # this method originally merely retrieved the last value of the key's time series;
-                # hence, the below performed the same as the current DataFileAggregator: Last
-                #
-                # key_data = data
-                #
-                # try:
-                #     for key in read_key.split('.'):
-                #         key_data = key_data[key]
-                # except KeyError:
-                #     pass
-                # else:
-                #     del key_stack[write_key]
-                #     points[write_key] = self.round_value(key_data)
-
-            if not op_stack:
-                break
-
-        # DEBUG: points['_path_count'] = path_count
+        points = self.reduce_points(op_stack)
 
         if self.flat:
             (points,) = points.values()
 
         return points
 
+    def reduce_points(self, op_stack):
+        """Apply the given mapping of aggregators to the data files'
+        datasets in a single pass, and return the mapping of their
+        results.
+
+        Unlike `get_points`, a bank which is `flat` may reduce multiple
+        aggregators; (their results are not themselves flattened, but
+        their decorations are).
+
+        Aggregators spanning long time windows may instead be reduced
+        over the rollups of the data file index, (in a second pass) --
+        see `plan_rollups`.
+
+        """
+        op_stack = dict(op_stack)
+        points = dict.fromkeys(op_stack)
+
+        self.register(*op_stack.values())
+
+        now = time.time()
+
+        rollup_stack = self.plan_rollups(op_stack, now)
+
+        file_stack = {write_key: op for (write_key, op) in op_stack.items()
+                      if write_key not in rollup_stack}
+
+        if file_stack:
+            (since, until) = self.plan_window(file_stack.values(), now)
+            self.reduce_datasets(file_stack, points, self.iter_datasets(since, until))
+
+        if rollup_stack:
+            (since, until) = self.plan_window(rollup_stack.values(), now)
+            datasets = self.iter_rollup_datasets(rollup_stack.values(), since, until, now)
+            self.reduce_datasets(rollup_stack, points, datasets)
+
+        return points
+
+    def reduce_datasets(self, op_stack, points, datasets):
+        """Apply the given mapping of aggregators to the given datasets,
+        recording their results to the mapping of `points`.
+
+        See `reduce_points`.
+
+        """
+        dataset_count = 0
+
+        try:
+            for (dataset, dataset1) in pairwise(datasets):
+                (data, full_data) = dataset
+
+                dataset_count += 1
+
+                for (write_key, aggregator) in tuple(op_stack.items()):
+                    try:
+                        points[write_key] = aggregator(
+                            data,
+                            points[write_key],
+                            {
+                                'data': full_data,
+                                'points': points,
+                                'write_key': write_key,
+                                'file_limit': self.file_limit,
+                                'last': dataset1 is None,
+                                'meta_prefix': self.meta_prefix,
+                                'flat': self.flat,
+                            },
+                        )
+                    except aggregator.stop_reduce as stop_reduce:
+                        points[write_key] = self.round_value(stop_reduce.value)
+                        del op_stack[write_key]
+
+                    #
+                    # note: the following is left for educational purposes only
+                    #
+                    # this method originally merely retrieved the last value of the key's time
+                    # series; hence, the below performed the same as the current
+                    # DataFileAggregator: Last
+                    #
+                    # key_data = data
+                    #
+                    # try:
+                    #     for key in read_key.split('.'):
+                    #         key_data = key_data[key]
+                    # except KeyError:
+                    #     pass
+                    # else:
+                    #     del key_stack[write_key]
+                    #     points[write_key] = self.round_value(key_data)
+
+                if not op_stack:
+                    break
+        finally:
+            # release any read-ahead upon early completion (or failure)
+            datasets.close()
+
+        DATAFILE_SCANNED.observe(dataset_count)
+
+    @staticmethod
+    def plan_window(ops, now=None):
+        """Determine the time range of the data files which may be read
+        by the given aggregators.
+
+        Returns a tuple of `(since, until)`, either of which may be None
+        to indicate that the range is unbounded.
+
+        """
+        if now is None:
+            now = time.time()
+
+        windows = [op.window(now) for op in ops]
+
+        if not windows or None in windows:
+            return (None, None)
+
+        (sinces, untils) = zip(*windows)
+
+        return (
+            None if None in sinces else min(sinces),
+            None if None in untils else max(untils),
+        )
+
+    def plan_rollups(self, op_stack, now=None):
+        """Determine which of the given mapping of aggregators may be
+        reduced over rollups rather than data files.
+
+        Aggregators are so reduced where a data file index is configured
+        and where they support rollups and span more than `rollup_age`
+        seconds, (such that their data files would be many).
+
+        Returns the mapping of these aggregators.
+
+        """
+        if self.index is None or self.rollup_age is None:
+            return {}
+
+        if now is None:
+            now = time.time()
+
+        rollup_stack = {}
+
+        for (write_key, op) in op_stack.items():
+            if not op.rollup:
+                continue
+
+            window = op.window(now)
+
+            if window is None or window[0] is None:
+                continue
+
+            if now - window[0] > self.rollup_age:
+                rollup_stack[write_key] = op
+
+        return rollup_stack
+
+    @staticmethod
+    def plan_period(since, now, max_buckets=DATAFILE_ROLLUP_POINTS):
+        """Select the finest rollup period yielding at most `max_buckets`
+        time buckets since the given time.
+
+        """
+        for period in ROLLUP_PERIODS:
+            if (now - since) / period <= max_buckets:
+                return period
+
+        return ROLLUP_PERIODS[-1]
+
+    def register(self, *ops):
+        """Extend the projection of cached data objects to include the
+        keys read by the given aggregators.
+
+        """
+        multikeys = itertools.chain.from_iterable(
+            op.iter_multikeys(self.prefix, self.meta_prefix) for op in ops
+        )
+
+        if PROJECTION.add(multikeys):
+            # cached objects are missing (newly) projected keys
+            self.get_json.cache_clear()
+
+            log.opt(lazy=True).debug('projection extended | keys: {}',
+                                     lambda: PROJECTION.tree)
+
     def round_value(self, value):
         if self.round_to is not None:
             if isinstance(value, numbers.Number):
@@ -165,7 +666,7 @@ class DataFileBank:
 
         return value
 
-    def iter_paths(self):
+    def iter_paths(self, since=None, until=None):
         """Generate data file paths in descending order.
 
         Data file directories are read in their order specified upon
@@ -174,6 +675,9 @@ class DataFileBank:
         these are consistenty labeled by timestamp, they are also
         therefore generated in descending time order).
 
+        Paths may be limited to those whose names' timestamps fall within
+        the time range `[since, until]` (see `prune_paths`).
+
         Paths will not be generated beyond the file limit specified upon
         instantiation.
 
@@ -188,10 +692,13 @@ class DataFileBank:
 
             paths_sorted = self.sorted_dir(path_dir, path_remainder)
 
+            if since is not None or until is not None:
+                paths_sorted = prune_paths(paths_sorted, since, until)
+
             for (path_count, path) in enumerate(paths_sorted, 1 + path_count):
                 yield path
 
-    def iter_datasets(self):
+    def iter_datasets(self, since=None, until=None, documents=None):
         """Generate data files' datasets.
 
         Files with incompatible encoding or serialization are ignored.
@@ -201,15 +708,20 @@ class DataFileBank:
           1. the data retrieved from the configured `prefix`
           2. the file's full data object
 
+        Where a data file index is configured, files' data are retrieved
+        from the index -- (and only files not yet indexed are read) --
+        and these data are limited to files' numeric values.
+
+        Alternatively, datasets may be generated from the given iterable
+        of data `documents`.
+
         See `iter_paths`.
 
         """
-        for path in self.iter_paths():
-            try:
-                full_data = self.get_json(path)
-            except self.DATA_FILE_READ_ERRORS:
-                continue
+        if documents is None:
+            documents = self.iter_documents(since, until)
 
+        for full_data in documents:
             if self.prefix:
                 try:
                     data = get_multikey(self.prefix, full_data)
@@ -220,20 +732,183 @@ class DataFileBank:
             else:
                 yield (full_data, full_data)
 
+    def iter_documents(self, since=None, until=None):
+        """Generate data files' full data objects.
+
+        See `iter_datasets`.
+
+        """
+        paths = self.iter_paths(since, until)
+
+        if self.index is None:
+            if self.prefetch > 0:
+                yield from self.iter_prefetched(paths)
+                return
+
+            for path in paths:
+                try:
+                    yield self.get_json(path)
+                except self.DATA_FILE_SKIP_ERRORS:
+                    pass
+        else:
+            for path_chunk in chunked(paths, DATAFILE_INDEX_BATCH):
+                for (_path, record) in self.index.load(path_chunk,
+                                                       self.read_datafile,
+                                                       self.DATA_FILE_SKIP_ERRORS):
+                    yield record
+
+    def iter_rollup_datasets(self, ops, since, until=None, now=None):
+        """Generate datasets of the rollups of the values read by the
+        given aggregators, as of the data file index.
+
+        Each time bucket of the rollups (within the time range `[since,
+        until]`) is treated as a data file whose values are the means
+        of its files' values; (for example, `Meta.Time` is the mean
+        time of the bucket's measurements).
+
+        Buckets are generated in descending order. The data file limit
+        does not apply.
+
+        See `plan_period` and `DataFileIndex.get_rollups`.
+
+        """
+        if now is None:
+            now = time.time()
+
+        self.sync_index_recent()
+
+        multikeys = set(itertools.chain.from_iterable(
+            op.iter_multikeys(self.prefix, self.meta_prefix) for op in ops
+        ))
+
+        period = self.plan_period(since, now)
+
+        documents = (
+            unflatten({multikey: total / count
+                       for (multikey, (count, total, *_stats)) in summaries.items()})
+            for (_bucket, summaries) in self.index.get_rollups(period, multikeys, since, until)
+        )
+
+        return self.iter_datasets(documents=documents)
+
+    def sync_index_recent(self):
+        """Index the most recent data files not yet indexed (or since
+        rewritten).
+
+        Paths are checked in descending order, in batches, until a
+        batch including indexed files is encountered.
+
+        """
+        for path_chunk in chunked(self.iter_paths(), DATAFILE_INDEX_BATCH):
+            novel = self.index.get_stale(path_chunk)
+
+            for _item in self.index.load(novel, self.read_datafile, self.DATA_FILE_READ_ERRORS):
+                pass
+
+            if len(novel) < len(path_chunk):
+                break
+
+    def iter_prefetched(self, paths):
+        """Generate the full data objects of the given data file paths,
+        reading ahead of the consumer.
+
+        A window of the next `prefetch` paths is read by a shared thread
+        pool, such that reads may overlap. Data are generated in order;
+        and, any reads outstanding upon the generator's closure are
+        cancelled.
+
+        """
+        executor = get_prefetch_executor()
+        paths = iter(paths)
+
+        pending = collections.deque(
+            executor.submit(self.get_json, path)
+            for path in itertools.islice(paths, self.prefetch)
+        )
+
+        try:
+            while pending:
+                task = pending.popleft()
+
+                for path in itertools.islice(paths, 1):
+                    pending.append(executor.submit(self.get_json, path))
+
+                try:
+                    full_data = task.result()
+                except self.DATA_FILE_SKIP_ERRORS:
+                    continue
+
+                yield full_data
+        finally:
+            for task in pending:
+                task.cancel()
+
     #
     # In testing against an HTTP endpoint whose query required ~500 files,
     # an LRU cache of the same size added a lag of ~10% to the initial request,
     # and reduced subsequent requests' time by an order of magnitude (~90%).
     #
-    # However: cache size should be ensured to be at least as large as the file
-    # limit, to ensure cache functionality.
+    # The cache is bounded by an approximate memory budget, (rather than by a
+    # number of files); and, its default policy (W-TinyLFU) is resistant to
+    # scans, such that one-off reads of older files do not evict those which
+    # are read frequently.
+    #
+    # Cached data objects are limited to the keys read by registered aggregators.
+    #
+    # (See: PROJECTION.)
+    #
+    # Cached data objects are keyed by files' identities rather than their paths,
+    # and by the version of the projection.
+    #
+    # (See: projected_key and sweep_caches.)
     #
     @staticmethod
-    @functools.lru_cache(maxsize=DATA_CACHE_SIZE)
+    @cached(make_cache(DATA_CACHE_BYTES, DATA_CACHE_POLICY),
+            key=projected_key,
+            lock=threading.Lock())
     def get_json(path):
-        with path.open() as fd:
+        return PROJECTION(DataFileBank.read_datafile(path))
+
+    #
+    # Exceptions aren't cached (above); rather, failures to read data files are
+    # recorded by DATAFILE_FAILURES, by files' mtimes and sizes, such that these
+    # are retried only once they've changed.
+    #
+    @staticmethod
+    def read_datafile(path):
+        if DATAFILE_FAILURES.check(path):
+            raise UnreadableDataFile(path)
+
+        try:
+            return DataFileBank.read_json(path)
+        except DataFileBank.DATA_FILE_READ_ERRORS:
+            DATAFILE_FAILURES.add(path)
+            raise
+
+    @staticmethod
+    def read_json(path):
+        with DATAFILE_PARSE_SECONDS.time(), path.open() as fd:
             return json.load(fd)
 
+    @staticmethod
+    def sorted_dir(path_dir, limit):
+        """List the directory's `limit` greatest paths in descending
+        order.
+
+        Listings of watched directories are retrieved from their
+        incrementally-maintained listings; otherwise, directories'
+        listings are cached (see `list_dir`).
+
+        """
+        listing = watch.get_listing(path_dir)
+
+        if listing is None:
+            DATAFILE_LISTINGS.labels('list_dir').inc()
+            return DataFileBank.list_dir(path_dir, limit)
+
+        DATAFILE_LISTINGS.labels('watch').inc()
+        return listing.largest(limit)
+
     #
     # As size of file archive grows and grows, becomes increasingly important to
     # cache its sorted listing as well.
@@ -244,46 +919,303 @@ class DataFileBank:
     # TTL cache on full argument list should be sufficient for now -- (arguments
     # stable across all typical invocations).
     #
+    # (Only consulted for directories which are not watched.)
+    #
     @staticmethod
     @cached(TTLCache(maxsize=100, ttl=(3600 * 24)), lock=threading.Lock())
-    def sorted_dir(path_dir, limit):
+    def list_dir(path_dir, limit):
         return heapq.nlargest(limit, path_dir.iterdir())
 
     @classmethod
-    def populate_caches(cls, file_limit=DATAFILE_LIMIT, dirs=DATA_PATHS):
-        """Pre- and/or re-populate file caches."""
+    def populate_caches(cls,
+                        file_limit=DATAFILE_LIMIT,
+                        dirs=DATA_PATHS,
+                        index=DATA_INDEX,
+                        workers=DATA_CACHE_WORKERS):
+        """Pre- and/or re-populate file caches.
+
+        Where a data file index is configured, files not yet indexed are
+        instead indexed, (and their data are not otherwise cached).
+
+        Where more than one worker is specified, files are read by a
+        pool of as many processes (see `populate_parallel`).
+
+        Cached data of files which are no longer present are first
+        evicted (see `sweep_caches`).
+
+        """
         log.opt(lazy=True).trace(
             'initial sizes | dirlists: {dirsize} | jsons: {jsize}',
-            dirsize=lambda: cls.sorted_dir.cache.currsize,
-            jsize=lambda: cls.get_json.cache_info().currsize,
+            dirsize=lambda: cls.list_dir.cache.currsize,
+            jsize=lambda: len(cls.get_json.cache),
         )
 
-        path_count = 0
+        time_start = time.perf_counter()
+
+        cls.sweep_caches(dirs)
+
+        paths = []
 
         for path_dir in dirs:
-            # set/reset sorted_dir()
-            paths_sorted = cls.sorted_dir.populate(path_dir, file_limit - path_count)
+            path_remainder = file_limit - len(paths)
+
+            if path_remainder <= 0:
+                break
+
+            if watch.get_listing(path_dir) is None:
+                # set/reset list_dir()
+                paths.extend(cls.list_dir.populate(path_dir, path_remainder))
+            else:
+                paths.extend(cls.sorted_dir(path_dir, path_remainder))
 
+        if workers > 1:
+            cls.populate_parallel(paths, index, workers)
+        elif index is None:
             # set/reset get_json()
-            for (path_count, path) in enumerate(paths_sorted, 1 + path_count):
+            for path in paths:
                 try:
                     cls.get_json(path)
-                except cls.DATA_FILE_READ_ERRORS:
+                except cls.DATA_FILE_SKIP_ERRORS:
+                    pass
+        else:
+            # extend index
+            for path_chunk in chunked(paths, DATAFILE_INDEX_BATCH):
+                for _item in index.load(path_chunk, cls.read_datafile, cls.DATA_FILE_READ_ERRORS):
                     pass
 
-            if path_count == file_limit:
-                break
+        if index is not None:
+            # extend index (and its rollups) beyond the file limit
+            cls.sync_index(dirs, index, workers)
+
+        log.info('populated caches | files: {} | workers: {} | elapsed: {:.2f}s',
+                 len(paths), max(workers, 1), time.perf_counter() - time_start)
 
         log.opt(lazy=True).trace(
-            'final sizes | dirlists: {dirsize} | jsons: {jsize}',
-            dirsize=lambda: cls.sorted_dir.cache.currsize,
-            jsize=lambda: cls.get_json.cache_info().currsize,
+            'final sizes | dirlists: {dirsize} | jsons: {jsize} | failures: {fsize}',
+            dirsize=lambda: cls.list_dir.cache.currsize,
+            jsize=lambda: len(cls.get_json.cache),
+            fsize=lambda: len(DATAFILE_FAILURES),
         )
 
+    @classmethod
+    def sync_index(cls, dirs, index, workers=DATA_CACHE_WORKERS, batch_size=500):
+        """Index all data files not yet indexed (or since rewritten),
+        regardless of the data file limit.
+
+        """
+        novel = []
+
+        for path_dir in dirs:
+            try:
+                paths = sorted(path_dir.iterdir(), reverse=True)
+            except FileNotFoundError:
+                continue
+
+            for path_chunk in chunked(paths, batch_size):
+                novel.extend(index.get_stale(path_chunk))
+
+        if workers > 1:
+            cls.populate_parallel(novel, index, workers)
+        else:
+            for path_chunk in chunked(novel, DATAFILE_INDEX_BATCH):
+                for _item in index.load(path_chunk, cls.read_datafile, cls.DATA_FILE_READ_ERRORS):
+                    pass
+
+        log.debug('synced index | novel files: {}', len(novel))
+
+    @classmethod
+    def is_cached(cls, path):
+        try:
+            cache_key = cls.get_json.key(path)
+        except FileNotFoundError:
+            return False
+
+        with cls.get_json.lock:
+            return cache_key in cls.get_json.cache
+
+    @classmethod
+    def sweep_caches(cls, dirs=DATA_PATHS):
+        """Evict cached data of files which are no longer present in any
+        of the data file directories, or which were projected by a prior
+        version of the projection.
+
+        (As cached data are keyed by file identity rather than location,
+        these are not otherwise invalidated.)
+
+        """
+        def exists(name):
+            for path_dir in dirs:
+                listing = watch.get_listing(path_dir)
+
+                if listing is None:
+                    if (path_dir / name).exists():
+                        return True
+                elif name in listing:
+                    return True
+
+            return False
+
+        with cls.get_json.lock:
+            cache_keys = list(cls.get_json.cache)
+
+        version = PROJECTION.version
+
+        stale_keys = [cache_key for cache_key in cache_keys
+                      if cache_key[-1] != version or not exists(cache_key[0])]
+
+        with cls.get_json.lock:
+            for cache_key in stale_keys:
+                if cache_key in cls.get_json.cache:
+                    del cls.get_json.cache[cache_key]
+
+        stale_names = [name for name in DATAFILE_FAILURES.keys() if not exists(name)]
+
+        for name in stale_names:
+            DATAFILE_FAILURES.pop(name)
+
+        log.debug('swept caches | evicted: {} | failures evicted: {}',
+                  len(stale_keys), len(stale_names))
+
+    @classmethod
+    def populate_parallel(cls, paths, index, workers, chunk_size=DATAFILE_INDEX_BATCH):
+        """Read the given data file paths via a pool of `workers`
+        processes, and install their data into this process's caches.
+
+        Only files not already cached (or indexed as of their current
+        contents), nor known to be unreadable, are read. Workers return files' data projected (or
+        flattened) -- see `read_datafiles`.
+
+        """
+        if index is None:
+            paths = [path for path in paths if not cls.is_cached(path)]
+        else:
+            paths = index.get_stale(paths)
+
+        paths = [path for path in paths if not DATAFILE_FAILURES.check(path)]
+
+        if not paths:
+            return
+
+        chunks = list(chunked(paths, chunk_size))
+
+        context = multiprocessing.get_context('spawn')
+
+        # data are cached as of the projection by which they're read
+        (version, tree) = (PROJECTION.version, PROJECTION.tree)
+
+        with futures.ProcessPoolExecutor(workers, mp_context=context) as executor:
+            tasks = {
+                executor.submit(read_datafiles, path_chunk, tree, index is not None):
+                path_chunk
+                for path_chunk in chunks
+            }
+
+            for (task_count, task) in enumerate(futures.as_completed(tasks), 1):
+                results = task.result()
+
+                if index is None:
+                    for (path, data) in results:
+                        try:
+                            cls.get_json.install(data, path, version)
+                        except FileNotFoundError:
+                            pass  # file moved or removed in the meantime
+
+                    read = {path.name for (path, _data) in results}
+                else:
+                    index.put_many(results)
+
+                    read = {name for (name, _identity, _data) in results}
+
+                for path in tasks[task]:
+                    if path.name not in read:
+                        DATAFILE_FAILURES.add(path)
+
+                log.debug('populating caches | chunks: {}/{}', task_count, len(chunks))
+
 
 populate_caches = DataFileBank.populate_caches
 
 
+def report_cache_metrics():
+    """Report the statistics of data file caches via their metrics."""
+    caches = (
+        ('get_json', DataFileBank.get_json.cache),
+        ('list_dir', DataFileBank.list_dir.cache),
+    )
+
+    for (cache_name, cache) in caches:
+        CACHE_HITS.labels(cache_name).set_function(lambda cache=cache: cache.hits)
+        CACHE_MISSES.labels(cache_name).set_function(lambda cache=cache: cache.misses)
+        CACHE_EVICTIONS.labels(cache_name).set_function(lambda cache=cache: cache.evictions)
+        CACHE_ITEMS.labels(cache_name).set_function(lambda cache=cache: len(cache))
+
+    CACHE_BYTES.labels('get_json').set_function(lambda: DataFileBank.get_json.cache.currsize)
+
+    # files known to be unreadable are skipped ("hits") or retried ("misses")
+    CACHE_HITS.labels('datafile_failures').set_function(lambda: DATAFILE_FAILURES.skips)
+    CACHE_MISSES.labels('datafile_failures').set_function(lambda: DATAFILE_FAILURES.retries)
+    CACHE_ITEMS.labels('datafile_failures').set_function(lambda: len(DATAFILE_FAILURES))
+
+
+report_cache_metrics()
+
+
+def read_datafiles(paths, tree=None, flat=False):
+    """Read the given data files for installation into the caches of
+    another process.
+
+    Returns a list of pairs of each file's path and its data projected
+    by the given projection `tree`; or, if `flat`, of triples of each
+    file's name, identity and flattened (numeric) data (see
+    `DataFileIndex`).
+
+    Unreadable files are omitted.
+
+    """
+    results = []
+
+    for path in paths:
+        try:
+            # (identified prior to reading lest a rewrite go unnoticed)
+            identity = identify(path) if flat else None
+
+            data = DataFileBank.read_json(path)
+        except DataFileBank.DATA_FILE_READ_ERRORS:
+            continue
+
+        if flat:
+            results.append((path.name, identity, dict(flatten(data))))
+        else:
+            results.append((path, Projection.select(data, tree) if tree else data))
+
+    return results
+
+
+def register(*ops):
+    """Register the given aggregators' keys with the projection of
+    cached data objects.
+
+    """
+    DataFileBank().register(*ops)
+
+
+def watch_dirs(dirs=DATA_PATHS, method=DATAFILE_WATCH, interval=DATAFILE_WATCH_INTERVAL,
+               stop_event=None):
+    """Launch a thread to maintain the listings of data file directories.
+
+    Returns None if directory watching is disabled.
+
+    """
+    if method == 'off' or not dirs:
+        return None
+
+    watcher = watch.watch(dirs, method, interval, stop_event)
+
+    generation.track()
+
+    return watcher
+
+
 class FlatFileBank(DataFileBank):
 
     def __init__(self, **kwargs):
@@ -293,10 +1225,32 @@ class FlatFileBank(DataFileBank):
         super().__init__(flat=True, **kwargs)
 
     def get_columns(self, read_key, age_s, *, decorate=None, reverse=False):
-        points = self.get_points(
-            Multi(read_key, age_s, decorate=decorate, reverse=reverse)
-        )
+        op = Multi(read_key, age_s, decorate=decorate, reverse=reverse)
+
+        (columns,) = self.get_column_groups(op).values()
+
+        return columns
+
+    def get_column_groups(self, *ops, **named_ops):
+        """Retrieve the columns of multiple aggregators -- generally of
+        type `Multi` -- in a single pass over the data files.
 
+        Columns are returned in a mapping of the aggregators' names,
+        (as with `DataFileBank.get_points`), to their columns, (as with
+        `get_columns`).
+
+        """
+        op_stack = dict(((str(op), op) for op in ops), **named_ops)
+
+        points = self.reduce_points(op_stack)
+
+        return {
+            write_key: self.make_columns(op.read_key, op.decorations, points[write_key])
+            for (write_key, op) in op_stack.items()
+        }
+
+    @staticmethod
+    def make_columns(read_key, decorate, points):
         if not points:
             count = 1 if isinstance(read_key, str) else len(read_key)
             if decorate:
@@ -331,6 +1285,10 @@ class DataFileAggregator(abc.ABC):
 
     stop_reduce = StopReduce
 
+    # whether the aggregator may be applied to the (mean) values of rollups' time
+    # buckets in lieu of data files' values (see DataFileBank.plan_rollups)
+    rollup = False
+
     def __init__(self, read_key, *, decorate=None):
         self.read_key = read_key
         self.decorations = decorate
@@ -339,6 +1297,31 @@ class DataFileAggregator(abc.ABC):
     def read_keys(self):
         return (self.read_key,) if isinstance(self.read_key, str) else self.read_key
 
+    @property
+    def decoration_keys(self):
+        if not self.decorations:
+            return ()
+
+        return (self.decorations,) if isinstance(self.decorations, str) else self.decorations
+
+    def iter_multikeys(self, prefix, meta_prefix):
+        """Generate the full dotted keys of the data file values read by
+        this aggregator.
+
+        """
+        for read_key in self.read_keys:
+            yield f'{prefix}.{read_key}' if prefix else read_key
+
+        for meta_key in self.decoration_keys:
+            yield f'{meta_prefix}.{meta_key}'
+
+    def window(self, now):
+        """Time range -- `(since, until)` -- of the data files read by
+        this aggregator, or None if unbounded.
+
+        """
+        return None
+
     def get_multikey(self, values):
         results = []
 
@@ -349,10 +1332,7 @@ class DataFileAggregator(abc.ABC):
 
     def decorate(self, value, context):
         if self.decorations:
-            if isinstance(self.decorations, str):
-                decorations = (self.decorations,)
-            else:
-                decorations = self.decorations
+            decorations = self.decoration_keys
 
             data = context['data']
             data_meta = data[context['meta_prefix']]
@@ -399,10 +1379,22 @@ class Last(DataFileAggregator):
 
 class Multi(DataFileAggregator):
 
-    def __init__(self, read_key, age_s, *, decorate=None, reverse=False):
+    rollup = True
+
+    def __init__(self, read_key, age_s, *, decorate=None, reverse=False, since=None, until=None):
         super().__init__(read_key, decorate=decorate)
         self.age_s = age_s
         self.reverse = reverse
+        self.since = since
+        self.until = until
+
+    def iter_multikeys(self, prefix, meta_prefix):
+        yield from super().iter_multikeys(prefix, meta_prefix)
+        yield f'{meta_prefix}.Time'
+
+    def window(self, now):
+        start = now - self.age_s
+        return (start if self.since is None else max(start, self.since), self.until)
 
     def __call__(self, current_values, collected, context):
         if collected is None:
@@ -414,23 +1406,31 @@ class Multi(DataFileAggregator):
         if time.time() - timestamp >= self.age_s:
             raise self.make_stop(collected)
 
-        try:
-            current_value = self.get_multikey(current_values)
-        except KeyError:
-            pass
-        else:
-            decorated = self.decorate(current_value, context)
+        # (exclusive of since)
+        if self.since is not None and timestamp <= self.since:
+            raise self.make_stop(collected)
 
-            if self.reverse:
-                collected.appendleft(decorated)
-            else:
-                collected.append(decorated)
+        if self.until is None or timestamp <= self.until:
+            self.collect(current_values, collected, context)
 
         if context['last']:
             raise self.make_stop(collected)
 
         return collected
 
+    def collect(self, current_values, collected, context):
+        try:
+            current_value = self.get_multikey(current_values)
+        except KeyError:
+            return
+
+        decorated = self.decorate(current_value, context)
+
+        if self.reverse:
+            collected.appendleft(decorated)
+        else:
+            collected.append(decorated)
+
     def make_stop(self, values):
         result = self.finalize(values)
         return self.stop_reduce(result)
@@ -441,6 +1441,9 @@ class Multi(DataFileAggregator):
 
 class StdDev(Multi):
 
+    # the deviation of buckets' means is not that of their values
+    rollup = False
+
     def __init__(self, *args, **kwargs):
         if 'decorate' in kwargs:
             raise TypeError("'decorate' is an invalid keyword argument for StdDev()")
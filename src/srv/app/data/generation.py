@@ -0,0 +1,37 @@
+"""Generation counter of the dashboard's data.
+
+The generation is advanced whenever the dashboard's data may have
+changed -- as data files arrive in (or leave) watched data file
+directories, and as trials and surveys are written -- such that
+results computed from the data may be cached until the generation
+moves on.
+
+Data files are only tracked once their directories are watched (see
+`app.data.file.watch_dirs`); until then, the generation does not
+reflect them, and is not `tracking`.
+
+"""
+import threading
+
+
+class DataGeneration:
+    """Monotonic counter of changes to the dashboard's data."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.value = 0
+        self.tracking = False
+
+    def advance(self):
+        with self.lock:
+            self.value += 1
+
+    def track(self):
+        """Flag that data files' changes are tracked (by a watcher)."""
+        self.tracking = True
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__}: {self.value}>'
+
+
+generation = DataGeneration()
@@ -0,0 +1,558 @@
+"""Persistent index of the numeric values of Netrics data files.
+
+Data files' (numeric) contents are flattened and recorded, once, to
+an on-disk SQLite database -- keyed by file name and measurement time
+(`Meta.Time`) -- such that repeated reads of the same files need
+never again retrieve and decode their full documents.
+
+Records are identified by their files' sizes and modification times,
+such that files rewritten under the same name are indexed anew.
+
+Indexed values are additionally rolled up by hourly and daily time
+buckets -- their counts, sums, sums of squares, minima and maxima --
+such that long time windows may be summarized without reading the
+files (nor records) they span (see `get_rollups`).
+
+Indexed values of selected keys are moreover summarized by quantile
+sketches, such that their percentiles (over all time) may be estimated
+in constant time and memory (see `get_sketch` and `app.lib.sketch`).
+
+"""
+import collections
+import json
+import numbers
+import sqlite3
+import threading
+
+from loguru import logger as log
+
+from app.lib.sketch import QuantileSketch
+
+
+PREPARE_INDEX = """\
+pragma journal_mode = wal;
+
+pragma synchronous = normal;
+
+create table if not exists datafile (
+    name text primary key,
+    ts real,
+    data text not null,
+    size integer,
+    mtime_ns integer
+) without rowid;
+
+create index if not exists datafile_ts on datafile (ts);
+
+create table if not exists rollup (
+    period integer not null,
+    bucket integer not null,
+    key text not null,
+    count integer not null,
+    total real not null,
+    squares real not null,
+    minimum real not null,
+    maximum real not null,
+    primary key (period, bucket, key)
+) without rowid;
+
+create table if not exists sketch (
+    key text primary key,
+    data text not null
+) without rowid;
+"""
+
+UPSERT_ROLLUP = """\
+insert into rollup values (?, ?, ?, ?, ?, ?, ?, ?)
+on conflict (period, bucket, key) do update set
+    count = count + excluded.count,
+    total = total + excluded.total,
+    squares = squares + excluded.squares,
+    minimum = min(minimum, excluded.minimum),
+    maximum = max(maximum, excluded.maximum)
+"""
+
+# schema version (pragma user_version) as of which rollups are maintained
+ROLLUP_VERSION = 1
+
+# schema version as of which records are identified by their files' size and mtime
+IDENTITY_VERSION = 2
+
+# lengths (in seconds) of the time buckets of rollups
+ROLLUP_PERIODS = (3600, 86400)
+
+
+def flatten(values, prefix=''):
+    """Generate the numeric leaves of the given tree of `values` as
+    pairs of their dotted keys and their values.
+
+    Non-numeric leaves -- strings, booleans, arrays, nulls -- are
+    omitted.
+
+    """
+    for (key, value) in values.items():
+        if isinstance(value, dict):
+            yield from flatten(value, f'{prefix}{key}.')
+        elif isinstance(value, numbers.Number) and not isinstance(value, bool):
+            yield (f'{prefix}{key}', value)
+
+
+def identify(path):
+    """Identify the contents of the data file at the given path by its
+    size and modification time (in nanoseconds).
+
+    """
+    stat = path.stat()
+    return (stat.st_size, stat.st_mtime_ns)
+
+
+def roll_up(records, periods=ROLLUP_PERIODS):
+    """Summarize the given pairs of measurement time and flattened data
+    by time bucket and key.
+
+    Returns a mapping of `(period, bucket, key)` to lists of `[count,
+    total, squares, minimum, maximum]`.
+
+    """
+    rollups = {}
+
+    for (ts, flat) in records:
+        if ts is None:
+            continue
+
+        for period in periods:
+            bucket = int(ts // period * period)
+
+            for (multikey, value) in flat.items():
+                # sums (of squares) of integers may exceed SQLite's
+                value = float(value)
+
+                try:
+                    summary = rollups[(period, bucket, multikey)]
+                except KeyError:
+                    rollups[(period, bucket, multikey)] = [1, value, value * value, value, value]
+                else:
+                    summary[0] += 1
+                    summary[1] += value
+                    summary[2] += value * value
+                    summary[3] = min(summary[3], value)
+                    summary[4] = max(summary[4], value)
+
+    return rollups
+
+
+def unflatten(flat):
+    """Construct a tree of values from the given mapping of dotted keys
+    to values.
+
+    """
+    values = {}
+
+    for (multikey, value) in flat.items():
+        (*parents, leaf) = multikey.split('.')
+
+        node = values
+        for key in parents:
+            node = node.setdefault(key, {})
+
+        node[leaf] = value
+
+    return values
+
+
+class DataFileIndex(threading.local):
+    """Persistent index of the numeric values of Netrics data files.
+
+    Data files are indexed by their names -- (rather than their full
+    paths) -- such that files need not be indexed anew should they be
+    moved between data file directories.
+
+    The values of the given dotted `sketch_keys` are additionally
+    summarized by quantile sketches.
+
+    Records are identified by their files' sizes and modification
+    times (see `identify`), such that files rewritten under the same
+    name are indexed anew. (Records indexed prior to the maintenance of
+    identities are identified as their files are next loaded.)
+
+    Index connections are opened per-thread.
+
+    """
+    def __init__(self, path, meta_prefix='Meta', sketch_keys=()):
+        self.path = path
+        self.meta_prefix = meta_prefix
+        self.sketch_keys = tuple(sketch_keys)
+
+    def make_connection(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.executescript(PREPARE_INDEX)
+        self.migrate(conn)
+        self.migrate_sketches(conn)
+        return conn
+
+    def migrate(self, conn):
+        """Add the columns of records' identities to indexes created
+        without them; and, roll up records indexed prior to the
+        maintenance of rollups.
+
+        """
+        count = 0
+
+        with conn:
+            conn.execute("begin immediate")
+
+            ((version,),) = conn.execute("pragma user_version")
+
+            if version >= IDENTITY_VERSION:
+                return
+
+            columns = {name for (_cid, name, *_info) in conn.execute("pragma table_info(datafile)")}
+
+            if 'size' not in columns:
+                conn.execute("alter table datafile add column size integer")
+                conn.execute("alter table datafile add column mtime_ns integer")
+
+            if version < ROLLUP_VERSION:
+                cursor = conn.execute("select ts, data from datafile where ts is not null")
+
+                while rows := cursor.fetchmany(1_000):
+                    records = [(ts, json.loads(data)) for (ts, data) in rows]
+                    self.put_rollups(conn, records)
+                    count += len(rows)
+
+            conn.execute(f"pragma user_version = {IDENTITY_VERSION}")
+
+        if count:
+            log.info('data file index | rolled up {} records', count)
+
+    def migrate_sketches(self, conn):
+        """Sketch the indexed values of sketch keys not yet sketched
+        (e.g. those newly configured).
+
+        """
+        if not self.sketch_keys:
+            return
+
+        with conn:
+            conn.execute("begin immediate")
+
+            sketched = {key for (key,) in conn.execute("select key from sketch")}
+
+            sketches = {key: QuantileSketch() for key in self.sketch_keys if key not in sketched}
+
+            if not sketches:
+                return
+
+            cursor = conn.execute("select data from datafile")
+
+            while rows := cursor.fetchmany(1_000):
+                self.sketch_records(sketches, (json.loads(data) for (data,) in rows))
+
+            self.put_sketches(conn, sketches)
+
+        log.info('data file index | sketched keys: {}', ', '.join(sketches))
+
+    def connect(self):
+        try:
+            conn = self.connection
+        except AttributeError:
+            conn = self.connection = self.make_connection()
+
+        return conn
+
+    def get_many(self, names):
+        """Retrieve the indexed records of the given file `names`.
+
+        Records are returned as a mapping of file name to pairs of the
+        file's identity (see `identify`) -- or `None` if it was indexed
+        without one -- and its (numeric) values.
+
+        Names which have not been indexed are omitted.
+
+        """
+        names = list(names)
+
+        if not names:
+            return {}
+
+        with self.connect() as conn:
+            cursor = conn.execute(
+                "select name, size, mtime_ns, data from datafile "
+                f"where name in ({', '.join('?' * len(names))})",
+                names,
+            )
+
+            return {
+                name: (None if size is None else (size, mtime_ns), unflatten(json.loads(data)))
+                for (name, size, mtime_ns, data) in cursor
+            }
+
+    def get_stale(self, paths):
+        """Determine which of the given data file `paths` have not been
+        indexed, or have been rewritten since they were indexed.
+
+        Paths no longer found are omitted; as are those indexed without
+        an identity, (which are identified as they're next loaded).
+
+        """
+        paths = list(paths)
+
+        identities = {}
+
+        for offset in range(0, len(paths), 500):
+            batch = [path.name for path in paths[offset:offset + 500]]
+
+            with self.connect() as conn:
+                cursor = conn.execute(
+                    "select name, size, mtime_ns from datafile "
+                    f"where name in ({', '.join('?' * len(batch))})",
+                    batch,
+                )
+
+                identities.update(
+                    (name, None if size is None else (size, mtime_ns))
+                    for (name, size, mtime_ns) in cursor
+                )
+
+        stale = []
+
+        for path in paths:
+            try:
+                identity = identify(path)
+            except FileNotFoundError:
+                continue
+
+            try:
+                indexed = identities[path.name]
+            except KeyError:
+                stale.append(path)
+            else:
+                if indexed is not None and indexed != identity:
+                    stale.append(path)
+
+        return stale
+
+    def put_many(self, records):
+        """Index the given triples of file name, file identity and
+        flattened file data.
+
+        Records are rolled up only as they're first indexed; (records
+        of files already indexed with the same identity are ignored).
+        Records of files indexed with a different identity replace
+        these, and their values are retracted from their rollups --
+        all but their minima and maxima, which may thereafter remain
+        conservative. (Nor may values be retracted from sketches.)
+
+        See `flatten` and `identify`.
+
+        """
+        rows = {
+            name: (flat.get(f'{self.meta_prefix}.Time'), json.dumps(flat), identity, flat)
+            for (name, identity, flat) in records
+        }
+
+        if not rows:
+            return
+
+        with self.connect() as conn:
+            cursor = conn.execute(
+                "select name, ts, data, size, mtime_ns from datafile "
+                f"where name in ({', '.join('?' * len(rows))})",
+                list(rows),
+            )
+
+            indexed = {name: (ts, data, (size, mtime_ns)) for (name, ts, data, size, mtime_ns)
+                       in cursor}
+
+            inserted = []
+            retracted = []
+
+            for (name, (ts, data, identity, flat)) in rows.items():
+                try:
+                    (ts0, data0, identity0) = indexed[name]
+                except KeyError:
+                    pass
+                else:
+                    if identity0 == identity or identity is None:
+                        continue
+
+                    retracted.append((ts0, json.loads(data0)))
+
+                conn.execute("insert or replace into datafile values (?, ?, ?, ?, ?)",
+                             (name, ts, data, *(identity or (None, None))))
+
+                inserted.append((ts, flat))
+
+            self.retract_rollups(conn, retracted)
+
+            self.put_rollups(conn, inserted)
+
+            if self.sketch_keys and inserted:
+                sketches = self.get_sketches(conn, self.sketch_keys)
+                self.sketch_records(sketches, (flat for (_ts, flat) in inserted))
+                self.put_sketches(conn, sketches)
+
+    @staticmethod
+    def put_rollups(conn, records):
+        conn.executemany(UPSERT_ROLLUP, (
+            (*rollup_key, *summary) for (rollup_key, summary) in roll_up(records).items()
+        ))
+
+    @staticmethod
+    def retract_rollups(conn, records):
+        rollups = roll_up(records)
+
+        conn.executemany(UPSERT_ROLLUP, (
+            (*rollup_key, -count, -total, -squares, minimum, maximum)
+            for (rollup_key, (count, total, squares, minimum, maximum)) in rollups.items()
+        ))
+
+        conn.executemany("delete from rollup where period = ? and bucket = ? and key = ? "
+                         "and count <= 0", rollups)
+
+    @staticmethod
+    def get_sketches(conn, multikeys):
+        sketches = dict.fromkeys(multikeys)
+
+        cursor = conn.execute(
+            f"select key, data from sketch where key in ({', '.join('?' * len(sketches))})",
+            list(sketches),
+        )
+
+        for (multikey, data) in cursor:
+            sketches[multikey] = QuantileSketch.from_dict(json.loads(data))
+
+        return {multikey: sketch or QuantileSketch() for (multikey, sketch) in sketches.items()}
+
+    @staticmethod
+    def put_sketches(conn, sketches):
+        conn.executemany("insert or replace into sketch values (?, ?)", (
+            (multikey, json.dumps(sketch.to_dict())) for (multikey, sketch) in sketches.items()
+        ))
+
+    @staticmethod
+    def sketch_records(sketches, flats):
+        for flat in flats:
+            for (multikey, sketch) in sketches.items():
+                if (value := flat.get(multikey)) is not None:
+                    sketch.add(value)
+
+    def get_sketch(self, multikey):
+        """Retrieve the quantile sketch of the indexed values of the
+        given dotted key (or `None` if the key is not sketched).
+
+        """
+        if multikey not in self.sketch_keys:
+            return None
+
+        with self.connect() as conn:
+            (sketch,) = self.get_sketches(conn, (multikey,)).values()
+
+        return sketch
+
+    def get_rollups(self, period, multikeys, since=None, until=None):
+        """Retrieve the rollups of the given dotted keys by time bucket
+        of the given `period`.
+
+        Rollups are returned in descending order of their buckets, as
+        pairs of the bucket's start time and a mapping of its keys to
+        their summaries, `(count, total, squares, minimum, maximum)`.
+
+        Buckets may be limited to those overlapping the time range
+        `[since, until]`.
+
+        """
+        multikeys = list(multikeys)
+
+        if not multikeys:
+            return []
+
+        query = f"""\
+            select bucket, key, count, total, squares, minimum, maximum from rollup
+            where period = ? and key in ({', '.join('?' * len(multikeys))})
+              and bucket >= ? and bucket <= ?
+            order by bucket desc
+        """
+
+        args = [
+            period,
+            *multikeys,
+            -float('inf') if since is None else since // period * period,
+            float('inf') if until is None else until,
+        ]
+
+        buckets = collections.defaultdict(dict)
+
+        with self.connect() as conn:
+            for (bucket, multikey, *summary) in conn.execute(query, args):
+                buckets[bucket][multikey] = tuple(summary)
+
+        return list(buckets.items())
+
+    def load(self, paths, loader, errors=()):
+        """Generate pairs of the given data file `paths` and their
+        indexed values.
+
+        Paths not already indexed -- or rewritten since they were
+        indexed -- are read via the given `loader`, and their contents
+        indexed. Paths for which the loader raises any of the given
+        `errors` are omitted.
+
+        Paths are generated in their given order.
+
+        """
+        paths = list(paths)
+
+        records = self.get_many(path.name for path in paths)
+
+        updates = []
+        identified = []
+
+        try:
+            for path in paths:
+                try:
+                    identity = identify(path)
+                except FileNotFoundError:
+                    # moved or removed since listed: its record (if any) stands
+                    identity = None
+
+                try:
+                    (indexed, record) = records[path.name]
+                except KeyError:
+                    indexed = record = None
+                else:
+                    if indexed is None and identity is not None:
+                        identified.append((path.name, identity))
+                    elif identity is not None and indexed != identity:
+                        record = None
+
+                if record is None:
+                    try:
+                        full_data = loader(path)
+                    except errors:
+                        continue
+
+                    flat = dict(flatten(full_data))
+                    updates.append((path.name, identity, flat))
+
+                    record = unflatten(flat)
+                    records[path.name] = (identity, record)
+
+                yield (path, record)
+        finally:
+            # index novel files even if iteration is abandoned
+            self.put_many(updates)
+            self.put_identities(identified)
+
+    def put_identities(self, identities):
+        """Record the given pairs of file name and identity of files
+        indexed without one.
+
+        """
+        if not identities:
+            return
+
+        with self.connect() as conn:
+            conn.executemany("update datafile set size = ?, mtime_ns = ? "
+                             "where name = ? and size is null",
+                             ((*identity, name) for (name, identity) in identities))
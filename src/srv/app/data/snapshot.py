@@ -0,0 +1,205 @@
+"""Snapshots of data file caches persisted to disk.
+
+Cached data file contents -- keyed by their files' identities (name,
+size and mtime) -- together with cached directory listings and the
+record of unreadable files, are written to a snapshot file, from which
+caches are restored upon restart.
+
+Thereafter, only those files which have since changed or arrived need
+be read.
+
+"""
+import gzip
+import json
+import os
+import pathlib
+import time
+
+import cachetools
+from loguru import logger as log
+
+from app import config
+
+from .file import (
+    path_or_none,
+    watch,
+    DataFileBank,
+    DATAFILE_FAILURES,
+    PROJECTION,
+)
+
+
+# path to which to write snapshots of data file caches (if any)
+DATA_CACHE_SNAPSHOT = config('DATA_CACHE_SNAPSHOT', default=None, cast=path_or_none)
+
+SNAPSHOT_VERSION = 1
+
+
+def covers(tree, subtree):
+    """Determine whether the projection `tree` includes all keys of
+    the projection `subtree`.
+
+    """
+    for (key, node) in subtree.items():
+        branch = tree.get(key)
+
+        if branch is True:
+            continue
+
+        if branch is None or node is True or not covers(branch, node):
+            return False
+
+    return True
+
+
+def dump(path=DATA_CACHE_SNAPSHOT):
+    """Write a snapshot of data file caches to the given path.
+
+    The snapshot is written to a temporary file and then moved into
+    place, such that an incomplete snapshot is never read.
+
+    """
+    if path is None:
+        return
+
+    time_start = time.perf_counter()
+
+    with DataFileBank.get_json.lock:
+        json_cache = DataFileBank.get_json.cache
+        entries = [(*cache_key, json_cache.peek(cache_key)) for cache_key in json_cache]
+
+    with DataFileBank.list_dir.lock:
+        dir_cache = DataFileBank.list_dir.cache
+        listed = [(cache_key, cachetools.Cache.__getitem__(dir_cache, cache_key))
+                  for cache_key in list(dir_cache)]
+
+    listings = []
+
+    for ((path_dir, limit), paths) in listed:
+        try:
+            dir_mtime_ns = path_dir.stat().st_mtime_ns
+        except FileNotFoundError:
+            continue
+
+        listings.append((str(path_dir), limit, dir_mtime_ns, [path.name for path in paths]))
+
+    snapshot = {
+        'version': SNAPSHOT_VERSION,
+        'projection': PROJECTION.tree,
+        'entries': entries,
+        'listings': listings,
+        'failures': DATAFILE_FAILURES.items(),
+    }
+
+    path_temp = path.with_name(f'.{path.name}.tmp')
+
+    try:
+        with gzip.open(path_temp, 'wt') as fd:
+            json.dump(snapshot, fd, separators=(',', ':'))
+
+        os.replace(path_temp, path)
+    except OSError as exc:
+        log.warning('cache snapshot not written | {}: {}', exc.__class__.__name__, exc)
+        return
+
+    log.info('dumped cache snapshot | files: {} | listings: {} | elapsed: {:.2f}s',
+             len(entries), len(listings), time.perf_counter() - time_start)
+
+
+def restore(path=DATA_CACHE_SNAPSHOT):
+    """Restore data file caches from the snapshot at the given path.
+
+    Cached data are restored only if the snapshot's projection covers
+    the current projection. (As data are keyed by their files'
+    identities, data of files which have since changed are never
+    retrieved; these are evicted by `DataFileBank.sweep_caches`.)
+
+    Directory listings are restored only if their directories are
+    unchanged since the snapshot.
+
+    """
+    if path is None:
+        return
+
+    time_start = time.perf_counter()
+
+    try:
+        with gzip.open(path, 'rt') as fd:
+            snapshot = json.load(fd)
+    except FileNotFoundError:
+        return
+    except (OSError, EOFError, ValueError) as exc:
+        log.warning('cache snapshot unreadable | {}: {}', exc.__class__.__name__, exc)
+        return
+
+    if snapshot.get('version') != SNAPSHOT_VERSION:
+        log.warning('cache snapshot unsupported | version: {}', snapshot.get('version'))
+        return
+
+    tree = PROJECTION.tree
+    snapshot_tree = snapshot['projection']
+
+    if snapshot_tree == tree:
+        entries = snapshot['entries']
+        project = None
+    elif not snapshot_tree or (tree and covers(snapshot_tree, tree)):
+        entries = snapshot['entries']
+        project = PROJECTION
+    else:
+        log.info('cache snapshot stale | projection extended since snapshot')
+        entries = ()
+        project = None
+
+    for (name, size, mtime_ns, data) in entries:
+        if project is not None:
+            data = project(data)
+
+        with DataFileBank.get_json.lock:
+            try:
+                DataFileBank.get_json.cache[cachetools.hashkey(name, size, mtime_ns)] = data
+            except ValueError:
+                pass  # value too large
+
+    listing_count = 0
+
+    for (path_dir, limit, dir_mtime_ns, names) in snapshot['listings']:
+        path_dir = pathlib.Path(path_dir)
+
+        if watch.get_listing(path_dir) is not None:
+            continue
+
+        try:
+            if path_dir.stat().st_mtime_ns != dir_mtime_ns:
+                continue
+        except FileNotFoundError:
+            continue
+
+        DataFileBank.list_dir.install([path_dir / name for name in names], path_dir, limit)
+        listing_count += 1
+
+    DATAFILE_FAILURES.update((name, tuple(identity)) for (name, identity) in snapshot['failures'])
+
+    log.info('restored cache snapshot | files: {} | listings: {} | elapsed: {:.2f}s',
+             len(entries), listing_count, time.perf_counter() - time_start)
+
+
+def populate_caches(path=DATA_CACHE_SNAPSHOT):
+    """Pre- and/or re-populate file caches, and snapshot the result.
+
+    Upon first invocation, caches are first restored from the snapshot
+    (if any), such that only files which have changed or arrived since
+    must be read.
+
+    See `DataFileBank.populate_caches`.
+
+    """
+    if not populate_caches.restored:
+        populate_caches.restored = True
+        restore(path)
+
+    DataFileBank.populate_caches()
+
+    dump(path)
+
+
+populate_caches.restored = False
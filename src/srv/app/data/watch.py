@@ -0,0 +1,361 @@
+"""Incrementally-maintained listings of data file directories.
+
+Directory listings are kept up to date by a background watcher thread
+-- via inotify (on Linux) or otherwise by polling directories' mtimes --
+such that new data files are listed within seconds of their arrival,
+without repeatedly listing the full (and ever-growing) directory.
+
+"""
+import bisect
+import ctypes
+import errno
+import os
+import select
+import struct
+import threading
+import time
+
+from loguru import logger as log
+
+from app.task import TaskThread
+
+from .generation import generation
+
+
+class DirectoryListing:
+    """Sorted listing of the names of a directory's files.
+
+    Changes to the listing advance the data generation (see
+    `app.data.generation`).
+
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.names = []
+        self.active = False
+        self.lock = threading.Lock()
+
+    def scan(self):
+        """(Re)-list the directory in full.
+
+        Returns whether the listing changed.
+
+        """
+        try:
+            names = sorted(entry.name for entry in os.scandir(self.path) if not entry.is_dir())
+        except FileNotFoundError:
+            self.reset()
+            return True
+
+        with self.lock:
+            changed = not self.active or names != self.names
+            self.names = names
+            self.active = True
+
+        if changed:
+            generation.advance()
+
+        return changed
+
+    def reset(self):
+        with self.lock:
+            self.names = []
+            self.active = False
+
+        generation.advance()
+
+    def add(self, name):
+        with self.lock:
+            index = bisect.bisect_left(self.names, name)
+
+            if index < len(self.names) and self.names[index] == name:
+                return False
+
+            self.names.insert(index, name)
+
+        generation.advance()
+        return True
+
+    def discard(self, name):
+        with self.lock:
+            index = bisect.bisect_left(self.names, name)
+
+            if index < len(self.names) and self.names[index] == name:
+                del self.names[index]
+            else:
+                return False
+
+        generation.advance()
+        return True
+
+    def __contains__(self, name):
+        with self.lock:
+            index = bisect.bisect_left(self.names, name)
+            return index < len(self.names) and self.names[index] == name
+
+    def largest(self, limit):
+        """List the paths of the directory's `limit` greatest file names
+        in descending order.
+
+        (Equivalent to `heapq.nlargest(limit, path.iterdir())`.)
+
+        """
+        with self.lock:
+            if not self.active:
+                raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), str(self.path))
+
+            names = self.names[:-limit - 1:-1] if limit > 0 else ()
+
+        return [self.path / name for name in names]
+
+    def __len__(self):
+        return len(self.names)
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.path!r})'
+
+
+#
+# registry of watched directory listings (by directory path)
+#
+# populated by the active watcher thread, and consulted by DataFileBank.sorted_dir().
+#
+listings = {}
+
+
+def get_listing(path):
+    """Retrieve the active listing of the given directory, if any."""
+    listing = listings.get(path)
+    return listing if listing is not None and listing.active else None
+
+
+class DirectoryWatcher(TaskThread):
+    """Base class of threads maintaining directory listings."""
+
+    def __init__(self, dirs, interval=5, stop_event=None):
+        super().__init__()
+        self.listings = [listings.setdefault(path, DirectoryListing(path)) for path in dirs]
+        self.interval = interval
+        self.stop_event = threading.Event() if stop_event is None else stop_event
+
+
+class PollingWatcher(DirectoryWatcher):
+    """Maintain directory listings by periodically checking the
+    directories' modification times, (and relisting those which have
+    changed).
+
+    """
+    # directories modified more recently than this are relisted regardless
+    # (in case of coarse file system timestamps)
+    mtime_resolution_ns = 2 * 10 ** 9
+
+    def __call__(self):
+        mtimes = dict.fromkeys(self.listings)
+
+        while not self.stop_event.is_set():
+            for listing in self.listings:
+                try:
+                    mtime = os.stat(listing.path).st_mtime_ns
+                except FileNotFoundError:
+                    mtime = None
+
+                if mtime == mtimes[listing] and (
+                    mtime is None or
+                    time.time_ns() - mtime > self.mtime_resolution_ns
+                ):
+                    continue
+
+                mtimes[listing] = mtime
+
+                if listing.scan():
+                    log.debug('directory watcher | relisted {}: {} files',
+                              listing.path, len(listing))
+
+            self.stop_event.wait(self.interval)
+
+
+class Inotify:
+    """Minimal interface to the Linux inotify API."""
+
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_MOVE_SELF = 0x00000800
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ONLYDIR = 0x01000000
+    IN_ISDIR = 0x40000000
+
+    IN_NONBLOCK = os.O_NONBLOCK
+    IN_CLOEXEC = 0o2000000
+
+    WATCH_MASK = (IN_CREATE | IN_MOVED_TO |
+                  IN_DELETE | IN_MOVED_FROM |
+                  IN_DELETE_SELF | IN_MOVE_SELF |
+                  IN_ONLYDIR)
+
+    EVENT_HEADER = struct.Struct('iIII')
+
+    @classmethod
+    def load(cls):
+        """Load the libc interface to inotify.
+
+        Raises OSError if inotify is unsupported.
+
+        """
+        try:
+            libc = ctypes.CDLL(None, use_errno=True)
+            (libc.inotify_init1, libc.inotify_add_watch, libc.inotify_rm_watch)
+        except (AttributeError, OSError) as exc:
+            raise OSError(errno.ENOSYS, 'inotify unsupported') from exc
+
+        return cls(libc)
+
+    def __init__(self, libc):
+        self.libc = libc
+
+        self.fd = libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+
+        if self.fd < 0:
+            self.raise_errno()
+
+    def raise_errno(self, path=None):
+        code = ctypes.get_errno()
+        raise OSError(code, os.strerror(code), path)
+
+    def add_watch(self, path, mask=WATCH_MASK):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+
+        if wd < 0:
+            self.raise_errno(str(path))
+
+        return wd
+
+    def rm_watch(self, wd):
+        self.libc.inotify_rm_watch(self.fd, wd)
+
+    def read(self, timeout):
+        """Generate events as (wd, mask, name) -- within the given
+        `timeout` in seconds.
+
+        """
+        (readable, _writable, _errored) = select.select([self.fd], [], [], timeout)
+
+        if not readable:
+            return
+
+        try:
+            buffer = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return
+
+        offset = 0
+
+        while offset < len(buffer):
+            (wd, mask, _cookie, length) = self.EVENT_HEADER.unpack_from(buffer, offset)
+            offset += self.EVENT_HEADER.size
+
+            name = buffer[offset:offset + length].rstrip(b'\0')
+            offset += length
+
+            yield (wd, mask, os.fsdecode(name))
+
+    def close(self):
+        os.close(self.fd)
+
+
+class InotifyWatcher(DirectoryWatcher):
+    """Maintain directory listings according to inotify events.
+
+    Listings are updated incrementally, as files are created in, or
+    moved into or out of, their directories.
+
+    Directories which do not (yet) exist are retried at each interval.
+
+    """
+    def __init__(self, dirs, interval=5, stop_event=None, inotify=None):
+        super().__init__(dirs, interval, stop_event)
+        self.inotify = Inotify.load() if inotify is None else inotify
+        self.watches = {}
+
+    def attach(self):
+        watched = set(self.watches.values())
+
+        for listing in self.listings:
+            if listing in watched:
+                continue
+
+            try:
+                wd = self.inotify.add_watch(listing.path)
+            except FileNotFoundError:
+                continue
+
+            self.watches[wd] = listing
+
+            # list only *after* watch added to ensure nothing missed
+            listing.scan()
+
+            log.debug('directory watcher | watching {}: {} files', listing.path, len(listing))
+
+    def __call__(self):
+        try:
+            while not self.stop_event.is_set():
+                self.attach()
+
+                for (wd, mask, name) in self.inotify.read(self.interval):
+                    self.handle(wd, mask, name)
+        finally:
+            self.inotify.close()
+
+    def handle(self, wd, mask, name):
+        if mask & Inotify.IN_Q_OVERFLOW:
+            log.warning('directory watcher | event queue overflow: relisting')
+
+            for listing in self.watches.values():
+                listing.scan()
+
+            return
+
+        try:
+            listing = self.watches[wd]
+        except KeyError:
+            return
+
+        if mask & (Inotify.IN_IGNORED | Inotify.IN_DELETE_SELF | Inotify.IN_MOVE_SELF):
+            # directory itself is gone: forget it and retry later
+            del self.watches[wd]
+            listing.reset()
+
+            if not mask & Inotify.IN_IGNORED:
+                self.inotify.rm_watch(wd)
+        elif mask & Inotify.IN_ISDIR:
+            pass
+        elif mask & (Inotify.IN_CREATE | Inotify.IN_MOVED_TO):
+            listing.add(name)
+        elif mask & (Inotify.IN_DELETE | Inotify.IN_MOVED_FROM):
+            listing.discard(name)
+
+
+def watch(dirs, method='auto', interval=5, stop_event=None):
+    """Launch a thread to maintain listings of the given directories.
+
+    The watch `method` may be any of: `inotify`, `poll` or `auto` --
+    the latter of which selects inotify where available.
+
+    """
+    if method not in ('auto', 'inotify', 'poll'):
+        raise ValueError(f'unsupported watch method: {method}')
+
+    if method != 'poll':
+        try:
+            return InotifyWatcher.launch(dirs, interval, stop_event)
+        except OSError as exc:
+            if method == 'inotify':
+                raise
+
+            log.warning('directory watcher | inotify unavailable ({}): polling', exc)
+
+    return PollingWatcher.launch(dirs, interval, stop_event)
@@ -0,0 +1,9 @@
+from bottle import get as GET, response
+
+from app.lib.metrics import REGISTRY
+
+
+@GET('/dashboard/metrics')
+def get_metrics():
+    response.content_type = 'text/plain; version=0.0.4; charset=utf-8'
+    return REGISTRY.render()
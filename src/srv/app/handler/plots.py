@@ -1,43 +1,156 @@
 import functools
+import itertools
+import math
 
-from bottle import get as GET
+from bottle import abort, get as GET, request
 
-from app.data.file import FlatFileBank, ONE_WEEK_S
+from app.data.downsample import downsample, METHODS, STEP_MIN
+from app.data.file import register, FlatFileBank, Multi, ONE_WEEK_S
 
 
-@GET('/dashboard/plots')
+Column = functools.partial(Multi, age_s=ONE_WEEK_S, decorate='Time', reverse=True)
+
+COLUMN_KEYS = dict(
+    bw=(
+        'ookla.speedtest_ookla_download',
+        'ookla.speedtest_ookla_upload',
+    ),
+    rtt=(
+        'ping_latency.google_rtt_avg_ms',
+        'ping_latency.amazon_rtt_avg_ms',
+        'ping_latency.wikipedia_rtt_avg_ms',
+    ),
+    dev=(
+      'connected_devices_arp.devices_active',
+      'connected_devices_arp.devices_1day',
+      'connected_devices_arp.devices_1week',
+      'connected_devices_arp.devices_total',
+    ),
+)
+
+
+def make_columns(since=None):
+    return {name: Column(keys, since=since) for (name, keys) in COLUMN_KEYS.items()}
+
+
+COLUMNS = make_columns()
+
+register(*COLUMNS.values())
+
+
+def clean_since():
+    try:
+        since = request.query['since']
+    except KeyError:
+        return None
+
+    try:
+        value = float(since)
+    except ValueError:
+        abort(400, 'Bad request: since: expected timestamp')
+
+    # (nor nan nor inf -- which would not serialize to JSON)
+    if not math.isfinite(value):
+        abort(400, 'Bad request: since: expected timestamp')
+
+    return value
+
+
+def clean_downsample():
+    """Parse the downsampling query parameters: `points` or `step`,
+    and `method`.
+
+    Returns None if downsampling is not requested.
+
+    """
+    (points, step) = (request.query.points, request.query.step)
+
+    if not points and not step:
+        return None
+
+    method = request.query.method or 'mean'
+
+    if (points and step) or method not in METHODS:
+        abort(400, 'Bad request')
+
+    try:
+        points = int(points) if points else None
+        step = float(step) if step else None
+    except ValueError:
+        abort(400, 'Bad request')
+
+    if (
+        (points is not None and points < (3 if method == 'lttb' else 1)) or
+        (step is not None and not (math.isfinite(step) and step >= STEP_MIN))
+    ):
+        abort(400, 'Bad request')
+
+    return dict(method=method, points=points, step=step)
+
+
+def downsample_group(group, method, points, step):
+    (*values, ts) = group
+
+    if ts is None:
+        return group
+
+    (ts, values) = downsample(ts, values, method, points=points, step=step)
+
+    return (*values, ts)
+
+
+def get_latest(columns, default=None):
+    """Determine the time of the latest point of the given column
+    groups, (each of which ends in its column of timestamps).
+
+    """
+    timestamps = itertools.chain.from_iterable(group[-1] or () for group in columns.values())
+    return max((ts for ts in timestamps if ts is not None), default=default)
+
+
+@GET('/dashboard/plots', cache=True, coalesce=True)
 def get_measurements():
-    bank = FlatFileBank(round_to=2)
+    """Retrieve the columns of the past week's measurements.
+
+    Given `since`, only measurements more recent than this timestamp
+    are retrieved -- such that clients may extend the columns they
+    already hold -- and data files are only read back to it.
+
+    The response's `latest` timestamp is that of the most recent point
+    retrieved (or else `since`), and may be passed as the `since` of the
+    subsequent request.
 
-    get_columns = functools.partial(bank.get_columns, age_s=ONE_WEEK_S, reverse=True)
+    Given `points` or `step`, each group of columns is downsampled to
+    at most `points` points, or to one point per `step` seconds (of at
+    least `STEP_MIN`), by the given `method`: `mean` (default), `min`
+    or `max` of time buckets, or `lttb` (see `app.data.downsample`) --
+    such that the response remains bounded in size regardless of the
+    number of data files.
+
+    """
+    since = clean_since()
+    downsampling = clean_downsample()
+
+    # columns are rounded only once the high-water mark is determined
+    bank = FlatFileBank()
 
     try:
-        (bw_dl, bw_ul, bw_ts) = get_columns(
-            (
-                'ookla.speedtest_ookla_download',
-                'ookla.speedtest_ookla_upload',
-            ),
-            decorate='Time',
-        )
-
-        (rtt_google, rtt_amazon, rtt_wikipedia, rtt_ts) = get_columns(
-            (
-                'ping_latency.google_rtt_avg_ms',
-                'ping_latency.amazon_rtt_avg_ms',
-                'ping_latency.wikipedia_rtt_avg_ms',
-            ),
-            decorate='Time',
-        )
-
-        (dev_now, dev_1d, dev_1w, dev_tot, dev_ts) = get_columns(
-            (
-              'connected_devices_arp.devices_active',
-              'connected_devices_arp.devices_1day',
-              'connected_devices_arp.devices_1week',
-              'connected_devices_arp.devices_total',
-            ),
-            decorate='Time',
-        )
+        # retrieve all columns in a single pass over data files
+        columns = bank.get_column_groups(**(COLUMNS if since is None else make_columns(since)))
+
+        latest = get_latest(columns, since)
+
+        if downsampling is not None:
+            columns = {name: downsample_group(group, **downsampling)
+                       for (name, group) in columns.items()}
+
+        columns = FlatFileBank(round_to=2).round_value(columns)
+
+        (bw_dl, bw_ul, bw_ts) = columns['bw']
+
+        (rtt_google, rtt_amazon, rtt_wikipedia, rtt_ts) = columns['rtt']
+
+        (dev_now, dev_1d, dev_1w, dev_tot, dev_ts) = columns['dev']
     except FileNotFoundError:
         # measurements (directory) not (yet) initialized
         #
@@ -68,6 +181,8 @@ def get_measurements():
                 '1w': None,
                 'tot': None,
             },
+            'since': since,
+            'latest': since,
         }
     else:
         return {
@@ -95,4 +210,6 @@ def get_measurements():
                 '1w': dev_1w,
                 'tot': dev_tot,
             },
+            'since': since,
+            'latest': latest,
         }
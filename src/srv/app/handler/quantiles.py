@@ -0,0 +1,57 @@
+from bottle import abort, get as GET, request
+
+from app.data.file import DATA_INDEX, DATAFILE_PREFIX, DATAFILE_SKETCH_KEYS
+
+
+DEFAULT_FRACTIONS = (0.1, 0.25, 0.5, 0.75, 0.9)
+
+
+def clean_fractions():
+    if not request.query.q:
+        return DEFAULT_FRACTIONS
+
+    try:
+        fractions = [float(arg) for arg in request.query.q.split(',')]
+    except ValueError:
+        abort(400, 'Bad request')
+
+    if not all(0 <= fraction <= 1 for fraction in fractions):
+        abort(400, 'Bad request')
+
+    return fractions
+
+
+@GET('/dashboard/quantiles')
+def get_quantiles():
+    """Estimate percentiles of the (all-time) values of a measurement
+    key.
+
+    Query parameters:
+
+    * `key`: dotted path of the measurement (under `Measurements`) --
+      one of `DATAFILE_SKETCH_KEYS`
+    * `q`: comma-separated fractions in `[0, 1]` at which to estimate
+      values (default: 0.1, 0.25, 0.5, 0.75, 0.9)
+
+    Estimates are retrieved from the quantile sketches of the data
+    file index -- and so are available only where an index is
+    configured. (See `app.lib.sketch` for their error bounds.)
+
+    """
+    key = request.query.key
+
+    if DATA_INDEX is None or key not in DATAFILE_SKETCH_KEYS:
+        abort(404, 'Not found')
+
+    fractions = clean_fractions()
+
+    sketch = DATA_INDEX.get_sketch(f'{DATAFILE_PREFIX}.{key}')
+
+    return {
+        'key': key,
+        'count': sketch.count,
+        'minimum': sketch.minimum,
+        'maximum': sketch.maximum,
+        'quantiles': dict(zip(map(str, fractions), sketch.quantiles(*fractions))),
+        'trimmed_mean': sketch.trimmed_mean(),
+    }
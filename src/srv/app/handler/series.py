@@ -0,0 +1,200 @@
+import math
+import re
+import time
+
+from bottle import abort, get as GET, request
+from decouple import Csv
+
+from app import config
+from app.data.downsample import bucket_mean, STEP_MIN
+from app.data.file import (
+    register,
+    FlatFileBank,
+    Last,
+    Multi,
+    StdDev,
+    DATAFILE_LIMIT,
+    DATAFILE_PREFIX,
+    ONE_WEEK_S,
+    PROJECTION,
+)
+
+
+# maximum number of keys per query
+SERIES_MAX_KEYS = config('SERIES_MAX_KEYS', default=8, cast=int)
+
+# maximum time span (in seconds) of queries
+SERIES_MAX_AGE = config('SERIES_MAX_AGE', default=(366 * 24 * 3600), cast=float)
+
+# maximum number of data files scanned per query
+SERIES_FILE_LIMIT = config('SERIES_FILE_LIMIT', default=DATAFILE_LIMIT, cast=int)
+
+# measurement keys which may be queried in addition to those read by the dashboard
+# (comma-separated dotted paths under Measurements)
+SERIES_KEYS = config('SERIES_KEYS', default='', cast=Csv())
+
+KEY_PATTERN = re.compile(r'[A-Za-z0-9_-]+(?:\.[A-Za-z0-9_-]+)*')
+
+AGGREGATORS = ('last', 'multi', 'stddev')
+
+register(*(Multi(key, ONE_WEEK_S) for key in SERIES_KEYS))
+
+
+def clean_keys():
+    keys = []
+
+    for arg in request.query.getall('key'):
+        for key in arg.split(','):
+            if not KEY_PATTERN.fullmatch(key):
+                abort(400, 'Bad request')
+
+            # only keys already projected may be queried -- novel keys would
+            # otherwise extend the projection, and so clear the data file cache
+            if f'{DATAFILE_PREFIX}.{key}' not in PROJECTION:
+                abort(400, 'Bad request: unsupported key')
+
+            if key not in keys:
+                keys.append(key)
+
+    if not 0 < len(keys) <= SERIES_MAX_KEYS:
+        abort(400, 'Bad request')
+
+    return keys
+
+
+def clean_time(param, now):
+    """Parse the timestamp of the given query parameter.
+
+    Timestamps are given in seconds since the epoch -- or, if not
+    positive, relative to `now`.
+
+    """
+    arg = getattr(request.query, param)
+
+    if not arg:
+        return None
+
+    try:
+        value = float(arg)
+    except ValueError:
+        abort(400, 'Bad request')
+
+    # (nor nan nor inf -- which would not serialize to JSON, nor bound windows)
+    if not math.isfinite(value):
+        abort(400, 'Bad request')
+
+    return now + value if value <= 0 else value
+
+
+def clean_step():
+    if not request.query.step:
+        return None
+
+    try:
+        step = float(request.query.step)
+    except ValueError:
+        abort(400, 'Bad request')
+
+    if not (math.isfinite(step) and step >= STEP_MIN):
+        abort(400, 'Bad request')
+
+    return step
+
+
+def make_op(agg, key, age_s, until):
+    if agg == 'last':
+        return Last(key, decorate='Time')
+
+    if agg == 'stddev':
+        return StdDev(key, age_s, until=until)
+
+    return Multi(key, age_s, decorate='Time', reverse=True, until=until)
+
+
+@GET('/dashboard/series', coalesce=True)
+def get_series():
+    """Retrieve the time series of arbitrary measurement keys.
+
+    Query parameters:
+
+    * `key`: dotted path of the measurement (under `Measurements`) --
+      repeated or comma-separated for multiple series
+    * `agg`: aggregation of each series: `last`, `multi` (default) or
+      `stddev`
+    * `since`/`until`: time range in seconds since the epoch, or
+      relative to now if not positive (default: the past week)
+    * `step`: length (in seconds) of the time buckets by which to
+      average the values of `multi` series
+
+    All series are read in a single pass over the data files, of at
+    most `SERIES_FILE_LIMIT` files.
+
+    Keys are limited to those of the projection of cached data objects
+    -- those read by the dashboard, and those configured by
+    `SERIES_KEYS` (see `app.data.file.register`) -- such that queries
+    never extend the projection, and so never invalidate the cache.
+
+    """
+    now = time.time()
+
+    keys = clean_keys()
+
+    agg = request.query.agg or 'multi'
+
+    if agg not in AGGREGATORS:
+        abort(400, 'Bad request')
+
+    since = clean_time('since', now)
+    until = clean_time('until', now)
+    step = clean_step()
+
+    if since is None:
+        since = now - ONE_WEEK_S
+
+    if now - since > SERIES_MAX_AGE or (until is not None and until < since):
+        abort(400, 'Bad request')
+
+    if (agg == 'last' and until is not None) or (agg != 'multi' and step is not None):
+        abort(400, 'Bad request')
+
+    ops = {key: make_op(agg, key, now - since, until) for key in keys}
+
+    bank = FlatFileBank(round_to=2, file_limit=SERIES_FILE_LIMIT)
+
+    try:
+        points = bank.reduce_points(ops)
+    except FileNotFoundError:
+        # measurements (directory) not (yet) initialized
+        #
+        # treat this no differently than missing data points
+        #
+        points = dict.fromkeys(keys)
+
+    series = {}
+
+    for key in keys:
+        if agg == 'last':
+            (value, ts) = points[key] or (None, None)
+
+            if ts is not None and ts < since:
+                (value, ts) = (None, None)
+
+            series[key] = {'ts': ts, 'value': value}
+        elif agg == 'stddev':
+            series[key] = {'value': points[key]}
+        else:
+            (values, ts) = bank.make_columns(key, 'Time', points[key])
+
+            if step is not None and ts is not None:
+                (ts, (values,)) = bucket_mean(ts, (values,), step)
+                values = bank.round_value(values)
+
+            series[key] = {'ts': ts, 'values': values}
+
+    return {
+        'agg': agg,
+        'since': since,
+        'until': until,
+        'step': step,
+        'series': series,
+    }
@@ -15,9 +15,11 @@ def handle_survey():
     except ValueError:
         abort(400, 'Bad request')
 
-    with db.client.connect() as conn:
+    def insert_survey(conn):
         conn.execute("insert into survey (subj) values (?)", (subj_code,))
 
+    db.client.submit(insert_survey).result(timeout=db.SQLITE_WRITE_TIMEOUT)
+
     return {
         'inserted': {
             'value': subj_label,
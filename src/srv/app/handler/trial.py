@@ -1,15 +1,24 @@
+import json
+import math
 import re
 import sqlite3
-import statistics
 
 from bottle import abort, get, post, put, request, response
 
+from app import config
 from app.data.db import sqlite as db
-from app.data.file import DataFileBank, Last
+from app.data.file import register, DataFileBank, Last
+from app.lib.metrics import Histogram
 
 
 TRIAL_REPORTING_TIMEOUT = 30
 
+# maximum number of trials listed per page -- (unless streamed)
+TRIAL_PAGE_MAX = config('TRIAL_PAGE_MAX', default=1_000, cast=int)
+
+# number of trials fetched at a time for streamed listings
+TRIAL_STREAM_BATCH = 500
+
 ACTIVE_TRIAL_CONDITION = """\
 size is null and period is null and (strftime('%s', 'now') - ts < ?)\
 """
@@ -26,6 +35,16 @@ CAST_TRUE = {'1', 'true', 'on'}
 CAST_FALSE = {'0', 'false', 'off', ''}
 CAST_VALUES = CAST_TRUE | CAST_FALSE
 
+OOKLA_DL = Last('ookla.speedtest_ookla_download')
+
+register(OOKLA_DL)
+
+QUERY_SECONDS = Histogram(
+    'dashboard_sqlite_query_seconds',
+    'Duration of SQLite queries (and their retrieval) of trials',
+    ('query',),
+)
+
 
 def clean_flag(flag):
     flag_arg = getattr(request.query, flag).lower()
@@ -67,37 +86,99 @@ def clean_limit():
         abort(400, 'Bad request')
 
 
-def build_where_clause():
-    where = ''
+def clean_ts(param):
+    arg = getattr(request.query, param)
+
+    if not arg:
+        return None
+
+    try:
+        return int(arg)
+    except ValueError:
+        abort(400, 'Bad request')
+
+
+def build_where_clause(*conjuncts):
+    """Construct the where clause (and its arguments) selecting trials
+    by the request's query flags.
+
+    Trials satisfying any of the flagged conditions are selected; and,
+    these must additionally satisfy all of the given `conjuncts` --
+    pairs of condition and argument.
+
+    """
+    conditions = []
     args = []
 
     if clean_flag('active'):
-        where = f'where ({ACTIVE_TRIAL_CONDITION})'
+        conditions.append(ACTIVE_TRIAL_CONDITION)
         args.append(TRIAL_REPORTING_TIMEOUT)
 
     if (period := clean_period()) is not None:
-        where += ' or ' if where else 'where '
-        where += f'({RECENT_TRIAL_CONDITION})'
+        conditions.append(RECENT_TRIAL_CONDITION)
         args.append(period)
 
     if clean_flag('complete'):
         if period:
             abort(400, 'Bad request')
 
-        where += ' or ' if where else 'where '
-        where += f'({COMPLETE_TRIAL_CONDITION})'
+        conditions.append(COMPLETE_TRIAL_CONDITION)
+
+    clauses = [' or '.join(f'({condition})' for condition in conditions)] if conditions else []
+
+    for (condition, arg) in conjuncts:
+        clauses.append(condition)
+        args.append(arg)
+
+    where = ('where ' + ' and '.join(f'({clause})' for clause in clauses)) if clauses else ''
 
     return (where, args)
 
 
 @get('/dashboard/trial/')
 def list_trials():
-    (where, args) = build_where_clause()
+    """List trials in descending order of their timestamps.
+
+    Listings are paginated by timestamp: trials may be selected
+    `before` and/or `after` given (exclusive) timestamps, and at most
+    `limit` (or `TRIAL_PAGE_MAX`) are listed. Where a page is full,
+    `next` specifies the cursor with which to retrieve the following
+    page -- (`before` its oldest trial, and any given `after`; or, if
+    paging forward from `after` alone, `after` its newest trial).
+
+    With the `stream` flag, all selected trials (up to any given
+    `limit`) are instead written incrementally, batch by batch (see
+    `stream_trials`).
+
+    """
+    before = clean_ts('before')
+    after = clean_ts('after')
+
+    (where, args) = build_where_clause(*(
+        (condition, value)
+        for (condition, value) in (('ts < ?', before), ('ts > ?', after))
+        if value is not None
+    ))
+
+    limit_value = clean_limit()
 
-    limit = '' if (limit_value := clean_limit()) is None else f'limit {limit_value}'
+    if limit_value is not None and limit_value < 0:
+        abort(400, 'Bad request')
+
+    if clean_flag('stream'):
+        response.content_type = 'application/json'
+        return stream_trials(where, args, limit_value)
+
+    page_size = TRIAL_PAGE_MAX if limit_value is None else min(limit_value, TRIAL_PAGE_MAX)
+
+    # page forward from `after` (if alone) -- else backward from `before` (or now)
+    forward = after is not None and before is None
 
-    with db.client.connect() as conn:
-        cursor = conn.execute(f"select * from trial {where} order by ts desc {limit}", args)
+    with QUERY_SECONDS.labels('list_trials').time(), db.client.read() as conn:
+        cursor = conn.execute(
+            f"select * from trial {where} order by ts {'asc' if forward else 'desc'} limit ?",
+            args + [page_size],
+        )
 
         names = [column[0] for column in cursor.description]
 
@@ -106,86 +187,161 @@ def list_trials():
             for row in cursor
         ]
 
+    if forward:
+        results.reverse()
+
+    if not results or len(results) < page_size:
+        cursor_next = None
+    elif forward:
+        cursor_next = {'after': results[0]['ts']}
+    elif after is None:
+        cursor_next = {'before': results[-1]['ts']}
+    else:
+        cursor_next = {'before': results[-1]['ts'], 'after': after}
+
     return {
         'selected': results,
         'count': len(results),
+        'next': cursor_next,
     }
 
 
-@get('/dashboard/trial/stats')
+def stream_trials(where, args, limit=None):
+    """Generate the JSON listing of the trials selected by the given
+    where clause (and its arguments), in descending order of their
+    timestamps, batch by batch.
+
+    Each batch of `TRIAL_STREAM_BATCH` trials is read by its own query,
+    (paging `before` the previous batch) -- such that a reader
+    connection is held only while the batch is read, and not while it
+    is written to the (perhaps slow) client.
+
+    """
+    yield '{"selected": ['
+
+    count = 0
+    before = None
+
+    while limit is None or count < limit:
+        batch_size = TRIAL_STREAM_BATCH if limit is None else min(TRIAL_STREAM_BATCH,
+                                                                  limit - count)
+
+        if before is None:
+            (batch_where, batch_args) = (where, args)
+        else:
+            batch_where = f'{where} and (ts < ?)' if where else 'where (ts < ?)'
+            batch_args = args + [before]
+
+        with QUERY_SECONDS.labels('stream_trials').time(), db.client.read() as conn:
+            cursor = conn.execute(f"select * from trial {batch_where} order by ts desc limit ?",
+                                  batch_args + [batch_size])
+
+            names = [column[0] for column in cursor.description]
+
+            results = [dict(zip(names, row)) for row in cursor]
+
+        if results:
+            yield (', ' if count else '') + ', '.join(json.dumps(result) for result in results)
+
+            count += len(results)
+            before = results[-1]['ts']
+
+        if len(results) < batch_size:
+            break
+
+    yield f'], "count": {count}}}'
+
+
+@get('/dashboard/trial/stats', cache=True)
 def stat_trials():
+    """Summarize the rates of completed trials.
+
+    Summaries are read from trial_stats, as maintained upon writes to
+    trial (see `app.data.db.sqlite`), rather than computed by scans of
+    trial: `stat_stdev` is the standard deviation of the rates of all
+    completed trials (rather than of only the latest 1000); and,
+    `stat_mean_win` is the mean of the rates within the window of their
+    2nd through 9th deciles -- as estimated by the quantile sketch of
+    trial rates, such that it is approximate once trials are many (e.g.
+    of 1194 or 1202 rates of 1500 rather than exactly 1200).
+
+    """
     recent_limit = 10 if (limit_value := clean_limit()) is None else limit_value
     if not 0 <= recent_limit <= 1000:
         abort(400, 'Bad request')
 
-    with db.client.connect() as conn:
-        (total_count,) = conn.execute(f"""\
-            select count(1) from trial
-            where {COMPLETE_TRIAL_CONDITION}
-        """).fetchone()
-
-        win_where = "where bucket between 2 and 9" if total_count > 8 else ""
+    with db.client.read() as conn:
+        # trial_stats is maintained upon writes to trial (see app.data.db.sqlite)
+        with QUERY_SECONDS.labels('stat_trials.summary').time():
+            (
+                total_count,
+                rate_count,
+                rate_total,
+                rate_squares,
+                stat_count_win,
+                win_total,
+                success_threshold,
+                success_count,
+            ) = conn.execute("""\
+                select count, rates, total, squares, win_count, win_total,
+                       success_threshold, success_count
+                from trial_stats
+            """).fetchone()
 
         # trial stores size as bytes and period as microseconds
         # we'll map to a rate of bytes/second
-        (stat_mean_win, stat_count_win) = conn.execute(f"""\
-            select avg(rate),
-                   count(1)
-
-            from (
-                select rate,
-                       ntile(10) over (order by rate) as bucket
-
-                from (
-                    select 1000000.0 * size / period as rate from trial
-                    where {COMPLETE_TRIAL_CONDITION}
-                )
-            )
-
-            {win_where}
-        """).fetchone()
-
-        # sqlite doesn't have a built-in stdev function; so we'll load ~all rates for stdev.
-        cursor = conn.execute(f"""
-            select ts, 1000000.0 * size / period as speed from trial
-            where {COMPLETE_TRIAL_CONDITION}
-            order by ts desc
-            limit 1000
-        """)
-        names = [column[0] for column in cursor.description]
-        history = [
-            dict(zip(names, row))
-            for row in cursor
-        ]
-        all_rates = [row['speed'] for row in history]
+        with QUERY_SECONDS.labels('stat_trials.history').time():
+            cursor = conn.execute(f"""
+                select ts, 1000000.0 * size / period as speed from trial
+                where {COMPLETE_TRIAL_CONDITION}
+                order by ts desc
+                limit ?
+            """, (recent_limit,))
+            names = [column[0] for column in cursor.description]
+            history = [
+                dict(zip(names, row))
+                for row in cursor
+            ]
+
+    stat_mean_win = win_total / stat_count_win if stat_count_win else None
+
+    if rate_count > 1:
+        variance = (rate_squares - rate_total * rate_total / rate_count) / (rate_count - 1)
+        stat_stdev = math.sqrt(max(variance, 0))
+    else:
+        stat_stdev = None
 
-        success_count = None
+    # data files are read -- and success recounted -- without holding a reader connection
+    ookla_dl = None
+
+    if total_count > 0:
+        file_bank = DataFileBank(flat=True)
 
-        if total_count > 0:
-            file_bank = DataFileBank(flat=True)
-
-            try:
-                ookla_dl = file_bank.get_points(Last('ookla.speedtest_ookla_download'))
-            except FileNotFoundError:
-                # measurements (directory) not (yet) initialized
-                #
-                # treat this no differently than missing data points
-                #
-                ookla_dl = None
-
-            if ookla_dl is not None:
-                cursor = conn.execute(f"""
-                    select count(1) from trial
-                    where {COMPLETE_TRIAL_CONDITION} and 8.0 * size / period > ?
-                """, (ookla_dl,))
-                (success_count,) = cursor.fetchone()
+        try:
+            ookla_dl = file_bank.get_points(OOKLA_DL)
+        except FileNotFoundError:
+            # measurements (directory) not (yet) initialized
+            #
+            # treat this no differently than missing data points
+            #
+            pass
+
+    if ookla_dl is None:
+        success_count = None
+    elif success_threshold != ookla_dl:
+        # success_count is maintained upon writes to trial -- and recounted only
+        # upon a new threshold (see app.data.db.sqlite.refresh_trial_success)
+        with QUERY_SECONDS.labels('stat_trials.success').time():
+            success_count = db.client.submit(
+                lambda conn: db.refresh_trial_success(conn, ookla_dl)
+            ).result(timeout=db.SQLITE_WRITE_TIMEOUT)
 
     return {
         'total_count': total_count,
         'stat_count_win': stat_count_win,
         'stat_mean_win': stat_mean_win,
-        'stat_stdev': statistics.stdev(all_rates) if len(all_rates) > 1 else None,
-        'recent_rates': history[:recent_limit],
+        'stat_stdev': stat_stdev,
+        'recent_rates': history,
         'success_count': success_count,
     }
 
@@ -209,13 +365,17 @@ def create_trial():
     else:
         query = "insert into trial default values returning ts"
 
-    with db.client.connect() as conn:
+    def insert_trial(conn):
         try:
             cursor = conn.execute(query, args)
         except sqlite3.IntegrityError:
-            ts = None
-        else:
-            (ts,) = cursor.fetchone() or (None,)
+            return None
+
+        (ts,) = cursor.fetchone() or (None,)
+        return ts
+
+    with QUERY_SECONDS.labels('create_trial').time():
+        ts = db.client.submit(insert_trial).result(timeout=db.SQLITE_WRITE_TIMEOUT)
 
     response.status = 409 if ts is None else 201
 
@@ -232,10 +392,26 @@ def upsert_trial(ts):
     except ValueError:
         abort(400, 'Bad request')
 
-    with db.client.connect() as conn:
+    (size, period) = values
+
+    def write_trial(conn):
+        (completed,) = conn.execute(f"""\
+            select exists (select 1 from trial where ts = ? and {COMPLETE_TRIAL_CONDITION})
+        """, (ts,)).fetchone()
+
         conn.execute("""\
             insert into trial values (?, ?, ?)
             on conflict (ts) do update set size=excluded.size, period=excluded.period
         """, [ts] + values)
 
+        # sketch rates of trials as they complete
+        # (the rates of trials already complete are not revised)
+        if not completed and period:
+            db.sketch_trial(conn, 1000000.0 * size / period)
+
+        db.refresh_trial_window(conn)
+
+    with QUERY_SECONDS.labels('upsert_trial').time():
+        db.client.submit(write_trial).result(timeout=db.SQLITE_WRITE_TIMEOUT)
+
     response.status = 204
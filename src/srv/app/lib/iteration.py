@@ -9,6 +9,13 @@ def pairwise(iterable):
     return itertools.zip_longest(a, b)
 
 
+def chunked(iterable, size):
+    """s -> (s0, s1, ..., sn-1), (sn, sn+1, ..., s2n-1), ..."""
+    iterator = iter(iterable)
+    while chunk := tuple(itertools.islice(iterator, size)):
+        yield chunk
+
+
 class PrimedIterator:
 
     class Sentinel:
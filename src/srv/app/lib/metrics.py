@@ -0,0 +1,279 @@
+"""Lightweight in-process metrics exposed in Prometheus text format.
+
+Metrics are recorded in memory -- at the cost of a lock and a few
+arithmetic operations per observation -- and rendered only as they're
+requested (see `app.handler.metrics`).
+
+Metrics may be labeled; labeled values are retrieved via `labels()`:
+
+    REQUEST_SECONDS = Histogram('request_seconds', 'Request latency', ('route',))
+
+    with REQUEST_SECONDS.labels('/dashboard/stats').time():
+        ...
+
+Counters and gauges may instead report the value of a callback at
+rendering time (see `set_function`).
+
+"""
+import bisect
+import contextlib
+import math
+import threading
+import time
+
+
+class Registry:
+    """Collection of metrics to render."""
+
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def register(self, metric):
+        with self.lock:
+            if metric.name in self.metrics:
+                raise ValueError(f'metric already registered: {metric.name}')
+
+            self.metrics[metric.name] = metric
+
+        return metric
+
+    def render(self):
+        """Render all registered metrics in Prometheus text format."""
+        with self.lock:
+            metrics = list(self.metrics.values())
+
+        lines = []
+
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.render())
+
+        lines.append('')
+
+        return '\n'.join(lines)
+
+
+REGISTRY = Registry()
+
+
+def format_value(value):
+    if value == math.inf:
+        return '+Inf'
+
+    if value == -math.inf:
+        return '-Inf'
+
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def format_labels(names, values, **extra):
+    pairs = list(zip(names, values)) + list(extra.items())
+
+    if not pairs:
+        return ''
+
+    escaped = (
+        (name, str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"'))
+        for (name, value) in pairs
+    )
+
+    return '{' + ','.join(f'{name}="{value}"' for (name, value) in escaped) + '}'
+
+
+class Metric:
+    """Base class of metrics, (optionally) labeled."""
+
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.children = {}
+        self.lock = threading.Lock()
+
+        if not self.labelnames:
+            self.children[()] = self.make_child()
+
+        if registry is not None:
+            registry.register(self)
+
+    def make_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        """Retrieve the metric for the given label values."""
+        if len(values) != len(self.labelnames):
+            raise ValueError(f'expected labels: {self.labelnames}')
+
+        values = tuple(str(value) for value in values)
+
+        try:
+            return self.children[values]
+        except KeyError:
+            with self.lock:
+                return self.children.setdefault(values, self.make_child())
+
+    @property
+    def unlabeled(self):
+        try:
+            return self.children[()]
+        except KeyError:
+            raise ValueError(f'metric is labeled: {self.labelnames}') from None
+
+    def render(self):
+        for (values, child) in list(self.children.items()):
+            for (suffix, extra, value) in child.samples():
+                labels = format_labels(self.labelnames, values, **extra)
+                yield f'{self.name}{suffix}{labels} {format_value(value)}'
+
+
+class CounterValue:
+
+    def __init__(self):
+        self.value = 0
+        self.function = None
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def set_function(self, function):
+        """Report the result of the given callable in lieu of a value,
+        (*e.g.* of a count maintained elsewhere).
+
+        """
+        self.function = function
+
+    def samples(self):
+        yield ('', {}, self.value if self.function is None else self.function())
+
+
+class Counter(Metric):
+    """Monotonically increasing count.
+
+    Counters' names are suffixed `_total` (if not already), such that
+    their samples are named as their metadata (`HELP` and `TYPE`).
+
+    """
+    kind = 'counter'
+
+    make_child = CounterValue
+
+    def __init__(self, name, *args, **kwargs):
+        if not name.endswith('_total'):
+            name += '_total'
+
+        super().__init__(name, *args, **kwargs)
+
+    def inc(self, amount=1):
+        self.unlabeled.inc(amount)
+
+    def set_function(self, function):
+        self.unlabeled.set_function(function)
+
+
+class GaugeValue:
+
+    def __init__(self):
+        self.value = 0
+        self.function = None
+        self.lock = threading.Lock()
+
+    def set(self, value):
+        with self.lock:
+            self.value = value
+
+    def set_function(self, function):
+        """Report the result of the given callable in lieu of a value."""
+        self.function = function
+
+    def samples(self):
+        yield ('', {}, self.value if self.function is None else self.function())
+
+
+class Gauge(Metric):
+    """Value which may rise and fall."""
+
+    kind = 'gauge'
+
+    make_child = GaugeValue
+
+    def set(self, value):
+        self.unlabeled.set(value)
+
+    def set_function(self, function):
+        self.unlabeled.set_function(function)
+
+
+class HistogramValue:
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+
+        with self.lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+
+    @contextlib.contextmanager
+    def time(self):
+        """Observe the duration of the context in seconds."""
+        time_start = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - time_start)
+
+    def samples(self):
+        with self.lock:
+            counts = list(self.counts)
+            (count, total) = (self.count, self.sum)
+
+        cumulative = 0
+
+        for (bound, bucket_count) in zip(self.buckets, counts):
+            cumulative += bucket_count
+            yield ('_bucket', {'le': format_value(bound)}, cumulative)
+
+        yield ('_sum', {}, total)
+        yield ('_count', {}, count)
+
+
+class Histogram(Metric):
+    """Distribution of observed values by bucket."""
+
+    kind = 'histogram'
+
+    DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS,
+                 registry=REGISTRY):
+        buckets = sorted(float(bound) for bound in buckets)
+
+        if not buckets or buckets[-1] != math.inf:
+            buckets.append(math.inf)
+
+        self.buckets = tuple(buckets)
+
+        super().__init__(name, documentation, labelnames, registry)
+
+    def make_child(self):
+        return HistogramValue(self.buckets)
+
+    def observe(self, value):
+        self.unlabeled.observe(value)
+
+    def time(self):
+        return self.unlabeled.time()
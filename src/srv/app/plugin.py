@@ -1,6 +1,50 @@
+import hashlib
+import json
+import threading
+from concurrent import futures
+
 import bottle
+from decouple import config
 from loguru import logger as log
 
+from app.data.cache import TTLCache
+from app.data.generation import generation
+from app.lib.metrics import Counter, Histogram
+
+
+# seconds for which cached responses are served (regardless of data generation)
+# -- such that responses reflecting sliding time windows are refreshed
+RESPONSE_CACHE_TTL = config('RESPONSE_CACHE_TTL', default=60, cast=float)
+
+# maximum number of responses cached per route
+RESPONSE_CACHE_SIZE = config('RESPONSE_CACHE_SIZE', default=64, cast=int)
+
+
+REQUEST_SECONDS = Histogram(
+    'dashboard_request_duration_seconds',
+    'Duration of requests by route',
+    ('method', 'route'),
+)
+
+REQUESTS_COALESCED = Counter(
+    'dashboard_requests_coalesced',
+    'Requests served the result of an identical request already in flight',
+    ('method', 'route'),
+)
+
+
+def request_key(args, kwargs):
+    """Construct a key identifying the current request by its route
+    callback's arguments and its query parameters, (irrespective of
+    their order).
+
+    """
+    return (
+        args,
+        tuple(sorted(kwargs.items())),
+        tuple(sorted(bottle.request.query.allitems())),
+    )
+
 
 class RouteErrorLogger:
 
@@ -13,3 +57,169 @@ class RouteErrorLogger:
             message=f"Error in function {route.callback.__name__}() for {route.method} {route.rule}:",
             reraise=True,
         )(callback)
+
+
+class RouteTimer:
+    """Record the duration of requests by route (see `REQUEST_SECONDS`).
+
+    Durations include the route callback only -- not the serialization
+    of its response.
+
+    """
+    name = 'route-timer'
+    api = 2
+
+    def apply(self, callback, route):
+        route_seconds = REQUEST_SECONDS.labels(route.method, route.rule)
+
+        def wrapper(*args, **kwargs):
+            with route_seconds.time():
+                return callback(*args, **kwargs)
+
+        return wrapper
+
+
+class RouteCoalescer:
+    """Coalesce concurrent identical requests of routes configured with
+    `coalesce=True` -- e.g.:
+
+        @get('/dashboard/plots', coalesce=True)
+
+    Requests arriving while an identical request -- (of the same route,
+    URL arguments and query parameters, irrespective of their order) --
+    is in flight wait upon its computation and share its result (or
+    its error), rather than repeating it (see `REQUESTS_COALESCED`).
+
+    Only routes whose results depend upon their requests' URLs alone,
+    and which return values safe to share between threads (and not,
+    e.g., generators), should be so configured.
+
+    """
+    name = 'coalescer'
+    api = 2
+
+    def apply(self, callback, route):
+        if not route.config.get('coalesce'):
+            return callback
+
+        coalesced = REQUESTS_COALESCED.labels(route.method, route.rule)
+
+        lock = threading.Lock()
+        flights = {}
+
+        def wrapper(*args, **kwargs):
+            key = request_key(args, kwargs)
+
+            with lock:
+                try:
+                    flight = flights[key]
+                except KeyError:
+                    flight = flights[key] = futures.Future()
+                    leader = True
+                else:
+                    leader = False
+
+            if not leader:
+                coalesced.inc()
+                return flight.result()
+
+            try:
+                result = callback(*args, **kwargs)
+            except BaseException as exc:
+                flight.set_exception(exc)
+                raise
+            else:
+                flight.set_result(result)
+                return result
+            finally:
+                with lock:
+                    del flights[key]
+
+        return wrapper
+
+
+class ResponseCache:
+    """Cache the JSON responses of routes configured with `cache=True`
+    by data generation (see `app.data.generation`) -- e.g.:
+
+        @get('/dashboard/stats', cache=True)
+
+    Responses are cached per request (see `request_key`) and served
+    for so long as the data generation is unchanged -- and for at most
+    `ttl` seconds, as results may nonetheless change with the passage
+    of time. Responses are tagged with an `ETag` of their content,
+    such that requests bearing a matching `If-None-Match` receive an
+    empty `304 Not Modified`.
+
+    Caching is disabled unless data files' changes are tracked (by the
+    directory watcher).
+
+    """
+    name = 'response-cache'
+    api = 2
+
+    def __init__(self, ttl=RESPONSE_CACHE_TTL, maxsize=RESPONSE_CACHE_SIZE):
+        self.ttl = ttl
+        self.maxsize = maxsize
+
+    def apply(self, callback, route):
+        if not route.config.get('cache'):
+            return callback
+
+        cache = TTLCache(maxsize=self.maxsize, ttl=self.ttl)
+        lock = threading.Lock()
+
+        def wrapper(*args, **kwargs):
+            if not generation.tracking:
+                return callback(*args, **kwargs)
+
+            key = request_key(args, kwargs)
+
+            # generation as of *before* computation (lest changes during it be missed)
+            current = generation.value
+
+            with lock:
+                entry = cache.get(key)
+
+            if entry is None or entry[0] != current:
+                result = callback(*args, **kwargs)
+
+                if not isinstance(result, dict):
+                    return result
+
+                body = json.dumps(result)
+                etag = '"{}"'.format(hashlib.blake2b(body.encode(), digest_size=8).hexdigest())
+
+                entry = (current, etag, body)
+
+                with lock:
+                    cache[key] = entry
+
+            (_generation, etag, body) = entry
+
+            bottle.response.set_header('ETag', etag)
+            bottle.response.set_header('Cache-Control', 'no-cache')
+
+            if self.matches(etag):
+                bottle.response.status = 304
+                return ''
+
+            bottle.response.content_type = 'application/json'
+            return body
+
+        return wrapper
+
+    @staticmethod
+    def matches(etag):
+        if_none_match = bottle.request.headers.get('If-None-Match')
+
+        if not if_none_match:
+            return False
+
+        if if_none_match.strip() == '*':
+            return True
+
+        return any(
+            tag.strip().removeprefix('W/') == etag
+            for tag in if_none_match.split(',')
+        )
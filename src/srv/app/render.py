@@ -0,0 +1,218 @@
+"""Background rendering of dashboard responses to static files.
+
+The responses of the dashboard's main routes change only as data
+arrive. These are therefore rendered -- by a background task, as the
+data generation advances (see `app.data.generation`) -- to JSON files
+(and their precompressed variants) under `APP_RENDER_ROOT`, from which
+they're served by WhiteNoise at their routes' URLs (see
+`RenderedWhiteNoise`), such that requests needn't read data at all.
+
+Each rendering is written to a new directory, and then published by
+atomically repointing the `current` symbolic link at it -- such that
+files are never served mid-write, nor mismatched with their variants.
+
+Routes are served as usual until first rendered.
+
+"""
+import gzip
+import os
+import shutil
+import time
+
+import bottle
+import whitenoise
+from loguru import logger as log
+
+from app import config
+from app.data.file import path_or_none
+from app.data.generation import generation
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# directory to which responses are rendered (default: disabled)
+APP_RENDER_ROOT = config('APP_RENDER_ROOT', default=None, cast=path_or_none)
+
+# seconds after which responses are rendered anew regardless of data generation
+# -- (as these reflect sliding time windows)
+APP_RENDER_MAX_AGE = config('APP_RENDER_MAX_AGE', default=60, cast=float)
+
+# renderings older than this multiple of APP_RENDER_MAX_AGE are not served
+# -- (lest these be served indefinitely should rendering fail)
+RENDER_STALE_FACTOR = 3
+
+RENDERED_URLS = (
+    '/dashboard/stats',
+    '/dashboard/plots',
+)
+
+CURRENT_LINK = 'current'
+
+
+def rendered_name(url):
+    return url.rstrip('/').rsplit('/', 1)[-1] + '.json'
+
+
+class Renderer:
+    """Render the responses of the routes of the given `urls` to JSON
+    files under `root`.
+
+    Renderers are callable as periodic tasks: responses are rendered
+    anew only once the data generation has advanced -- (or once their
+    rendering is older than `max_age` seconds).
+
+    """
+    def __init__(self, root=APP_RENDER_ROOT, urls=RENDERED_URLS, max_age=APP_RENDER_MAX_AGE,
+                 keep=2):
+        self.root = root
+        self.urls = urls
+        self.max_age = max_age
+        self.keep = keep
+
+        self.rendered_generation = None
+        self.rendered_at = None
+
+    def __call__(self):
+        if (
+            self.rendered_at is not None and
+            self.rendered_generation == generation.value and
+            time.monotonic() - self.rendered_at < self.max_age
+        ):
+            return False
+
+        self.render()
+        return True
+
+    def render(self):
+        # generation as of *before* rendering (lest changes during it be missed)
+        current = generation.value
+        time_start = time.monotonic()
+
+        directory = self.root / str(time.time_ns())
+        directory.mkdir(parents=True)
+
+        try:
+            for url in self.urls:
+                self.render_url(url, directory / rendered_name(url))
+        except BaseException:
+            shutil.rmtree(directory, ignore_errors=True)
+            raise
+
+        link_temp = self.root / f'{CURRENT_LINK}.tmp'
+
+        if link_temp.is_symlink():
+            link_temp.unlink()
+
+        link_temp.symlink_to(directory.name)
+        os.replace(link_temp, self.root / CURRENT_LINK)
+
+        self.prune()
+
+        self.rendered_generation = current
+        self.rendered_at = time.monotonic()
+
+        log.debug('rendered responses | generation: {} | elapsed: {:.2f}s',
+                  current, self.rendered_at - time_start)
+
+    @staticmethod
+    def render_url(url, path):
+        environ = {'PATH_INFO': url, 'REQUEST_METHOD': 'GET', 'QUERY_STRING': ''}
+
+        (route, args) = bottle.default_app().match(environ)
+
+        # callbacks may read the request (e.g. its query) -- bind this (thread-local)
+        # request as if served
+        bottle.request.bind(environ)
+        bottle.response.bind()
+
+        body = bottle.json_dumps(route.callback(**args)).encode()
+
+        # variants are written first, such that these are never older than their file
+        path.with_name(path.name + '.gz').write_bytes(gzip.compress(body))
+
+        if brotli is not None:
+            path.with_name(path.name + '.br').write_bytes(brotli.compress(body))
+
+        path.write_bytes(body)
+
+    def prune(self):
+        """Remove all but the most recent `keep` renderings."""
+        directories = sorted(
+            (path for path in self.root.iterdir() if path.is_dir() and path.name.isdigit()),
+            key=lambda path: int(path.name),
+        )
+
+        for directory in directories[:-self.keep]:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+class RenderedWhiteNoise(whitenoise.WhiteNoise):
+    """WhiteNoise additionally serving rendered responses under
+    `render_root` at their routes' URLs (see `Renderer`).
+
+    Rendered files are looked up anew as they're republished; and, as
+    any other static file, served with their precompressed variants and
+    support for conditional requests.
+
+    Requests with query strings are not served rendered files; nor are
+    requests served renderings older than `RENDER_STALE_FACTOR` times
+    `render_max_age` seconds. Rather, these fall through to their
+    routes.
+
+    """
+    def __init__(self, application, render_root=None, render_urls=RENDERED_URLS,
+                 render_max_age=APP_RENDER_MAX_AGE, **kwargs):
+        self.render_root = render_root
+        self.render_names = {url: rendered_name(url) for url in render_urls}
+        self.render_stale_age = RENDER_STALE_FACTOR * render_max_age
+        self.rendered = {}
+
+        super().__init__(application, **kwargs)
+
+    def __call__(self, environ, start_response):
+        if (
+            self.render_root is not None and
+            environ['REQUEST_METHOD'] in ('GET', 'HEAD') and
+            # parameterized requests (e.g. plots' since) are left to their routes
+            not environ.get('QUERY_STRING')
+        ):
+            url = environ.get('PATH_INFO', '')
+
+            if url in self.render_names and (static_file := self.find_rendered(url)):
+                return self.serve(static_file, environ, start_response)
+
+        return super().__call__(environ, start_response)
+
+    def find_rendered(self, url):
+        path = os.path.realpath(self.render_root / CURRENT_LINK / self.render_names[url])
+
+        try:
+            rendered_at = os.stat(path).st_mtime
+        except FileNotFoundError:
+            return None
+
+        if time.time() - rendered_at > self.render_stale_age:
+            return None
+
+        try:
+            (rendered_path, static_file) = self.rendered[url]
+        except KeyError:
+            pass
+        else:
+            if rendered_path == path:
+                return static_file
+
+        static_file = self.get_static_file(path, url)
+        self.rendered[url] = (path, static_file)
+
+        return static_file
+
+    def add_cache_headers(self, headers, path, url):
+        if url in self.render_names:
+            # rendered responses change -- revalidate
+            headers['Cache-Control'] = 'no-cache'
+        else:
+            super().add_cache_headers(headers, path, url)
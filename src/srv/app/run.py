@@ -8,7 +8,6 @@ import sys
 
 import bottle
 import schedule
-import whitenoise
 from decouple import config
 from loguru import logger as log
 
@@ -71,11 +70,23 @@ def init_tasks():
     #
     # avoid circular dependency (for config)
     datafile = importlib.import_module('app.data.file')
+    snapshot = importlib.import_module('app.data.snapshot')
+    sqlite = importlib.import_module('app.data.db.sqlite')
+    render = importlib.import_module('app.render')
+
+    # load handlers
+    #
+    # handlers register the data they read, and these should be registered
+    # before caches are populated.
+    init_submodules(handler)
 
     # schedule tasks
     #
     # pre- and/or re-populate file caches.
     #
+    # Caches are first restored from their snapshot on disk (if any), and
+    # snapshotted anew upon each population (see app.data.snapshot).
+    #
     # Wraps the DataFileBank method, to suppress FileNotFoundError, for
     # use as a periodic task. A race condition may exist between the
     # initialization of this service and of the measurement service(s);
@@ -86,9 +97,22 @@ def init_tasks():
     # caches in the main thread is negligible; and, subsequent task
     # invocations *may* proceed without issue.
     #
-    cache_task = task.SafeTask(datafile.populate_caches, exc=FileNotFoundError, level='WARNING')
+    cache_task = task.SafeTask(snapshot.populate_caches, exc=FileNotFoundError, level='WARNING')
     cache_job = schedule.every(4).hours.do(cache_task)
 
+    # checkpoint the database's write-ahead log, and close idle connections
+    #
+    # (SQLite checkpoints automatically as transactions are committed; however,
+    # passive checkpoints between writes keep the log short and reads fast.)
+    #
+    schedule.every(10).minutes.do(task.SafeTask(sqlite.client.checkpoint))
+    schedule.every(1).minutes.do(task.SafeTask(sqlite.client.close_idle))
+
+    # render main dashboard responses to static files (served by WhiteNoise)
+    # as their data change (see app.render)
+    if render.APP_RENDER_ROOT is not None:
+        schedule.every(5).seconds.do(task.SafeTask(render.Renderer()))
+
     log.opt(lazy=True).debug('scheduled jobs | added {}', lambda: len(schedule.get_jobs()))
 
     # init executioners
@@ -98,6 +122,16 @@ def init_tasks():
 
     stop_event = executioner.stop_event
 
+    # DirectoryWatcher maintains listings of data file directories
+    #
+    # (until a directory is first listed by the watcher, its listing is
+    # instead cached as before)
+    datafile.watch_dirs(stop_event=stop_event)
+
+    # the database client's writer thread (if write-behind) commits queued writes
+    # until stopped
+    sqlite.client.stop_event = stop_event
+
     # ItemExecutioner runs one-off tasks as they're enqueued
     #
     # for now we just want to force this one task, once, on start-up:
@@ -123,6 +157,9 @@ def logging(func):
             configure_logging(log_level)
 
             bottle.install(plugin.RouteErrorLogger())
+            bottle.install(plugin.RouteTimer())
+            bottle.install(plugin.ResponseCache())
+            bottle.install(plugin.RouteCoalescer())
 
         return func(*args, **kwargs)
 
@@ -160,16 +197,21 @@ def main():
 
     init_submodules(handler)
 
+    render = importlib.import_module('app.render')
+
     bottle_app = bottle.app()
 
     # WhiteNoise not strictly required --
     # Bottle does support static assets --
     # (but, WhiteNoise is more robust, etc.)
-    whitenoise_app = whitenoise.WhiteNoise(
+    #
+    # (WhiteNoise additionally serves rendered responses -- see app.render)
+    whitenoise_app = render.RenderedWhiteNoise(
         bottle_app,
         autorefresh=APP_RELOAD,
         index_file=True,
         prefix='/dashboard/',
+        render_root=render.APP_RENDER_ROOT,
         root=STATIC_PATH,
     )
 
@@ -7,6 +7,16 @@ import time
 import schedule
 from loguru import logger as log
 
+from app.lib.metrics import Histogram
+
+
+TASK_SECONDS = Histogram(
+    'dashboard_task_duration_seconds',
+    'Duration of background tasks',
+    ('task',),
+    buckets=(0.01, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 900),
+)
+
 
 class SafeTask:
     """Wrap the given callable `func` to suppress exceptions `exc`.
@@ -14,21 +24,28 @@ class SafeTask:
     Uncaught exceptions raised by task callables so wrapped will not
     interrupt the task thread.
 
+    Task durations are recorded by `TASK_SECONDS`, labeled by the
+    callable's name -- or, for callable instances (which have none), by
+    the name of their class.
+
     """
     def __init__(self, func, exc=(Exception,), level='ERROR'):
         self.func = func
         self.exc = exc
         self.level = level
 
+        self.name = getattr(func, '__name__', type(func).__name__)
+
     def __call__(self, *args, **kwargs):
         try:
-            return self.func(*args, **kwargs)
+            with TASK_SECONDS.labels(self.name).time():
+                return self.func(*args, **kwargs)
         except self.exc as error:
-            log.log(self.level, '{0.__name__} | {1.__class__.__name__}: {1}', self.func, error)
+            log.log(self.level, '{0} | {1.__class__.__name__}: {1}', self.name, error)
             return None
 
     def __repr__(self):
-        return f"{self.__class__.__name__}({self.func.__name__})"
+        return f"{self.__class__.__name__}({self.name})"
 
 
 class ThreadEnumerator(dict):
@@ -0,0 +1,13 @@
+import os
+import tempfile
+
+
+# configure the app against scratch data -- prior to its import (and configuration)
+WORKDIR = tempfile.mkdtemp(prefix='netrics-dash-test-')
+
+os.environ['APP_DATABASE'] = f'file:{WORKDIR}/data.sqlite'
+os.environ['DATAFILE_PENDING'] = f'{WORKDIR}/pending'
+os.environ['DATAFILE_ARCHIVE'] = f'{WORKDIR}/archive'
+
+for name in ('pending', 'archive'):
+    os.mkdir(os.path.join(WORKDIR, name))
@@ -0,0 +1,54 @@
+import json
+import os
+
+from app.data.index import DataFileIndex
+
+
+def write_datafile(path, timestamp, download):
+    data = {
+        'Measurements': {
+            'ookla': {
+                'speedtest_ookla_download': download,
+            },
+        },
+        'Meta': {
+            'Time': timestamp,
+        },
+    }
+
+    path.write_text(json.dumps(data))
+
+
+def read_datafile(path):
+    return json.loads(path.read_text())
+
+
+def test_rewritten(tmp_path):
+    index = DataFileIndex(tmp_path / 'index.sqlite')
+
+    path = tmp_path / '1.json'
+    write_datafile(path, 3600, 50.0)
+
+    ((_path, record),) = index.load([path], read_datafile)
+    assert record['Measurements']['ookla']['speedtest_ookla_download'] == 50.0
+
+    assert index.get_stale([path]) == []
+
+    # rewrite the file under the same name (as of a distinct mtime)
+    write_datafile(path, 3600, 70.0)
+    os.utime(path, ns=(path.stat().st_atime_ns, path.stat().st_mtime_ns + 1_000_000))
+
+    assert index.get_stale([path]) == [path]
+
+    ((_path, record),) = index.load([path], read_datafile)
+    assert record['Measurements']['ookla']['speedtest_ookla_download'] == 70.0
+
+    ((_path, record),) = index.load([path], read_datafile)
+    assert record['Measurements']['ookla']['speedtest_ookla_download'] == 70.0
+
+    # rollups retract the file's prior values
+    multikey = 'Measurements.ookla.speedtest_ookla_download'
+
+    ((bucket, summaries),) = index.get_rollups(3600, [multikey])
+    assert bucket == 3600
+    assert summaries[multikey][:3] == (1, 70.0, 4900.0)
@@ -0,0 +1,78 @@
+import datetime
+import json
+import os
+import time
+from concurrent import futures
+
+import schedule
+
+from app import render, task
+from app.data import file as datafile
+from app.handler import current_stats, plots  # noqa: F401 (routes to render)
+
+
+def write_datafile(timestamp, download):
+    data = {
+        'Measurements': {
+            'ookla': {
+                'speedtest_ookla_download': download,
+                'speedtest_ookla_upload': download / 10,
+            },
+        },
+        'Meta': {
+            'Time': timestamp,
+        },
+    }
+
+    with open(datafile.DATAFILE_PENDING / f'{timestamp}.json', 'w') as fd:
+        json.dump(data, fd)
+
+
+def test_render(tmp_path):
+    now = int(time.time())
+
+    write_datafile(now - 600, 50.0)
+    write_datafile(now - 300, 60.0)
+
+    renderer = render.Renderer(root=tmp_path)
+
+    # render as scheduled: from a thread other than that serving requests
+    with futures.ThreadPoolExecutor(1) as executor:
+        executor.submit(renderer.render).result()
+
+    current = tmp_path / render.CURRENT_LINK
+
+    assert sorted(os.listdir(current)) == sorted(
+        name + suffix
+        for name in map(render.rendered_name, render.RENDERED_URLS)
+        for suffix in ('', '.gz') + (('.br',) if render.brotli else ())
+    )
+
+    stats = json.loads((current / 'stats.json').read_text())
+
+    assert stats['ookla_dl'] == 60.0
+
+    plots_data = json.loads((current / 'plots.json').read_text())
+
+    assert plots_data['bw']['ts'] == [now - 600, now - 300]
+    assert plots_data['bw']['dl'] == [50.0, 60.0]
+    assert plots_data['since'] is None
+    assert plots_data['latest'] == now - 300
+
+
+def test_render_scheduled(tmp_path):
+    # schedule the renderer as does app.run
+    job = schedule.every(5).seconds.do(task.SafeTask(render.Renderer(root=tmp_path)))
+
+    try:
+        job.next_run = datetime.datetime.now()
+
+        task.ScheduleExecutioner.run_pending()
+    finally:
+        schedule.cancel_job(job)
+
+    assert job.last_run is not None
+
+    stats = json.loads((tmp_path / render.CURRENT_LINK / 'stats.json').read_text())
+
+    assert 'ookla_dl' in stats
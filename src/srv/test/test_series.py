@@ -0,0 +1,29 @@
+import bottle
+import pytest
+
+from app.handler import current_stats, series  # noqa: F401 (projects the series' key)
+
+
+def get_series(query):
+    environ = {'PATH_INFO': '/dashboard/series', 'REQUEST_METHOD': 'GET', 'QUERY_STRING': query}
+
+    bottle.request.bind(environ)
+    bottle.response.bind()
+
+    return series.get_series()
+
+
+@pytest.mark.parametrize('param', ('since', 'until'))
+@pytest.mark.parametrize('value', ('nan', 'inf', '-inf'))
+def test_time_finite(param, value):
+    with pytest.raises(bottle.HTTPError) as info:
+        get_series(f'key=ookla.speedtest_ookla_download&{param}={value}')
+
+    assert info.value.status_code == 400
+
+
+def test_time_relative():
+    result = get_series('key=ookla.speedtest_ookla_download&since=-3600')
+
+    assert result['until'] is None
+    assert result['series']['ookla.speedtest_ookla_download'] is not None
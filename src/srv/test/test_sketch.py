@@ -0,0 +1,91 @@
+import bisect
+import random
+
+import pytest
+
+from app.lib.sketch import QuantileSketch
+
+
+# documented bound of normalized rank error (for k=200)
+RANK_ERROR = 0.015
+
+FRACTIONS = [index / 100 for index in range(1, 100)]
+
+
+def rank_errors(sketch, values):
+    """Compute the normalized rank error of the sketch's estimate of
+    each of `FRACTIONS` of the given values.
+
+    """
+    ordered = sorted(values)
+
+    return [
+        abs(bisect.bisect_right(ordered, estimate) / len(ordered) - fraction)
+        for (fraction, estimate) in zip(FRACTIONS, sketch.quantiles(*FRACTIONS))
+    ]
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('distribution', ('uniform', 'lognormal', 'sorted'))
+def test_rank_error(seed, distribution):
+    stream = random.Random(seed)
+
+    if distribution == 'lognormal':
+        values = [stream.lognormvariate(3, 1) for _index in range(50_000)]
+    else:
+        values = [stream.random() for _index in range(50_000)]
+
+    if distribution == 'sorted':
+        values.sort()
+
+    sketch = QuantileSketch(k=200, seed=seed)
+    sketch.extend(values)
+
+    errors = rank_errors(sketch, values)
+
+    assert max(errors) < RANK_ERROR
+
+    assert sketch.size <= 3 * sketch.k
+
+
+def test_rank_error_merged():
+    stream = random.Random(0)
+
+    values = [stream.gauss(100, 15) for _index in range(50_000)]
+
+    sketches = [QuantileSketch(k=200, seed=seed) for seed in range(10)]
+
+    for (index, value) in enumerate(values):
+        sketches[index % len(sketches)].add(value)
+
+    (sketch, *others) = sketches
+
+    for other in others:
+        sketch.merge(other)
+
+    assert len(sketch) == len(values)
+
+    assert max(rank_errors(sketch, values)) < RANK_ERROR
+
+
+def test_exact_below_k():
+    values = list(range(150))
+    random.Random(0).shuffle(values)
+
+    sketch = QuantileSketch(k=200)
+    sketch.extend(values)
+
+    assert sketch.quantiles(0, 0.5, 1) == [0, 74, 149]
+
+    assert sketch.rank(99) == 100
+
+    assert sketch.trimmed_mean(0.1, 0.9) == pytest.approx(74.5)
+
+
+def test_serialization():
+    sketch = QuantileSketch(seed=0)
+    sketch.extend(random.Random(0).random() for _index in range(10_000))
+
+    restored = QuantileSketch.from_dict(sketch.to_dict())
+
+    assert restored.quantiles(*FRACTIONS) == sketch.quantiles(*FRACTIONS)